@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+framebuffer.py
+
+A small RGB raster shared by the frame generators (stick_man.py,
+stick_man_2.py, 3d_cube.py, mvp_video_demo.py, shimmer_gen_relu.py).
+
+Framebuffer.pixels is a plain bytearray of width*height*3 bytes (row-major
+RGB), ready for MVPWriter.add_frame or save_png.write_png. Every primitive
+clips to the frame and writes with slice assignment: a filled rectangle is
+one assignment of a replicated colour pattern per row, a vertical line is
+one extended-slice assignment per channel, and line() writes each row's run
+of a Bresenham line as one span. Ranges are half-open like range():
+fill_rect(x0, y0, x1, y1) covers x0 <= x < x1, y0 <= y < y1.
+
+For scenes where little moves, LayerStack renders the static layers once
+and keeps the result as immutable bytes; each frame starts as a copy of it
+and the moving parts are stamped in as Sprites. A sprite's mask (alpha or a
+colour key) is turned into opaque runs per row when it is built, so blit()
+costs one slice assignment per run: proportional to the sprite, not the
+frame.
+"""
+import re
+
+_OPAQUE = re.compile(rb'\xff+')
+_PARTIAL = re.compile(rb'[\x01-\xfe]')
+
+class Framebuffer:
+    def __init__(self, width, height, color=(0, 0, 0)):
+        self.width, self.height = width, height
+        self.stride = width * 3
+        self.pixels = bytearray(bytes(color) * (width * height)) if any(color) \
+            else bytearray(width * height * 3)
+
+    @classmethod
+    def from_bytes(cls, width, height, data):
+        """A framebuffer holding a (mutable) copy of width*height*3 RGB bytes."""
+        if len(data) != width * height * 3:
+            raise ValueError("expected {} bytes, got {}".format(width * height * 3, len(data)))
+        fb = cls.__new__(cls)
+        fb.width, fb.height, fb.stride = width, height, width * 3
+        fb.pixels = bytearray(data)
+        return fb
+
+    def fill(self, color):
+        """Set every pixel to color."""
+        self.pixels[:] = bytes(color) * (self.width * self.height)
+
+    def fill_rect(self, x0, y0, x1, y1, color):
+        x0, x1 = max(x0, 0), min(x1, self.width)
+        y0, y1 = max(y0, 0), min(y1, self.height)
+        if x0 >= x1 or y0 >= y1:
+            return
+        row = bytes(color) * (x1 - x0)
+        px, stride = self.pixels, self.stride
+        start = y0 * stride + x0 * 3
+        for y in range(y0, y1):
+            px[start:start + len(row)] = row
+            start += stride
+
+    def hline(self, x0, x1, y, color):
+        """Pixels x0 <= x < x1 of row y."""
+        if 0 <= y < self.height:
+            x0, x1 = max(x0, 0), min(x1, self.width)
+            if x0 < x1:
+                start = y * self.stride + x0 * 3
+                self.pixels[start:start + (x1 - x0) * 3] = bytes(color) * (x1 - x0)
+
+    def vline(self, x, y0, y1, color):
+        """Pixels y0 <= y < y1 of column x."""
+        if 0 <= x < self.width:
+            y0, y1 = max(y0, 0), min(y1, self.height)
+            if y0 < y1:
+                start, stop = y0 * self.stride + x * 3, y1 * self.stride
+                for c, v in enumerate(bytes(color)):
+                    self.pixels[start + c:stop:self.stride] = bytes((v,)) * (y1 - y0)
+
+    def set_pixel(self, x, y, color):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            i = (y * self.width + x) * 3
+            self.pixels[i:i + 3] = bytes(color)
+
+    def line(self, x0, y0, x1, y1, color):
+        """Bresenham line from (x0, y0) to (x1, y1), both ends included.
+
+        Same pixels as the classic err = dx - dy loop, but each run along the
+        major axis is found in closed form, so only the rows (columns, for
+        steep lines) inside the frame are visited and each is one span.
+        """
+        dx, dy = abs(x1 - x0), abs(y1 - y0)
+        sx = 1 if x0 < x1 else -1
+        sy = 1 if y0 < y1 else -1
+        if dx >= dy:
+            major, minor, a0, b0, sa, sb, n = dx, dy, x0, y0, sx, sy, self.height
+        else:   # steep: the same walk with the axes swapped
+            major, minor, a0, b0, sa, sb, n = dy, dx, y0, x0, sy, sx, self.width
+        # minor-axis steps k whose coordinate b0 + sb*k is inside the frame
+        if sb > 0:
+            klo, khi = max(0, -b0), min(minor, n - 1 - b0)
+        else:
+            klo, khi = max(0, b0 - n + 1), min(minor, b0)
+        for k in range(klo, khi + 1):
+            # after k minor steps the error is major*(k+1) - minor*(i+1) at
+            # major offset i: the minor step comes at the first i with
+            # 2*minor*(i+1) > major*(2k+1), a diagonal one if also
+            # 2*minor*(i+1) < 2*major*(k+1) + minor
+            if minor:
+                end = min(major * (2 * k + 1) // (2 * minor), major)
+                if k:
+                    prev = major * (2 * k - 1) // (2 * minor)
+                    start = prev + (2 * minor * (prev + 1) < 2 * major * k + minor)
+                else:
+                    start = 0
+            else:
+                start, end = 0, major
+            p, q = a0 + sa * start, a0 + sa * end
+            if p > q:
+                p, q = q, p
+            if dx >= dy:
+                self.hline(p, q + 1, b0 + sb * k, color)
+            else:
+                self.vline(b0 + sb * k, p, q + 1, color)
+
+    def blit(self, sprite, x, y):
+        """Stamp sprite with its top-left corner at (x, y), clipped to the frame."""
+        px, stride = self.pixels, self.stride
+        for sy in range(max(0, -y), min(sprite.height, self.height - y)):
+            base = (y + sy) * stride
+            for x0, x1, data in sprite.runs[sy]:
+                a, b = max(x + x0, 0), min(x + x1, self.width)
+                if a < b:
+                    px[base + a * 3:base + b * 3] = data[(a - x - x0) * 3:(b - x - x0) * 3]
+            for sx, color, alpha in sprite.blends[sy]:
+                if 0 <= x + sx < self.width:
+                    i = base + (x + sx) * 3
+                    for c in range(3):
+                        px[i + c] = (color[c] * alpha + px[i + c] * (255 - alpha) + 127) // 255
+
+class Sprite:
+    """
+    A small RGB image with a mask, for Framebuffer.blit.
+    - pixels: width*height*3 RGB bytes
+    - alpha: width*height bytes (255 opaque, 0 transparent, in between blended),
+      or None for a fully opaque sprite
+    """
+
+    def __init__(self, width, height, pixels, alpha=None):
+        self.width, self.height = width, height
+        self.runs = []     # per row: [(x0, x1, rgb bytes)] of fully opaque pixels
+        self.blends = []   # per row: [(x, (r, g, b), alpha)] of partly transparent ones
+        stride = width * 3
+        for y in range(height):
+            row = bytes(pixels[y * stride:(y + 1) * stride])
+            if alpha is None:
+                self.runs.append([(0, width, row)])
+                self.blends.append([])
+                continue
+            mask = bytes(alpha[y * width:(y + 1) * width])
+            self.runs.append([(m.start(), m.end(), row[m.start() * 3:m.end() * 3])
+                              for m in _OPAQUE.finditer(mask)])
+            self.blends.append([(m.start(), tuple(row[m.start() * 3:m.start() * 3 + 3]),
+                                 mask[m.start()]) for m in _PARTIAL.finditer(mask)])
+
+    @classmethod
+    def from_framebuffer(cls, fb, key=None, alpha=None):
+        """Sprite from a drawn Framebuffer; pixels of colour `key` are transparent."""
+        if key is not None:
+            key = bytes(key)
+            px = fb.pixels
+            alpha = bytes(0 if px[i:i + 3] == key else 255 for i in range(0, len(px), 3))
+        return cls(fb.width, fb.height, fb.pixels, alpha)
+
+class LayerStack:
+    """
+    Static layers composited once into a cached, immutable background.
+    add(draw) appends a layer: draw(fb) paints it onto a Framebuffer.
+    frame() returns a new Framebuffer that starts as a copy of the background.
+    """
+
+    def __init__(self, width, height, color=(0, 0, 0)):
+        self.width, self.height = width, height
+        self.color = color
+        self.layers = []
+        self._background = None
+
+    def add(self, draw):
+        self.layers.append(draw)
+        self._background = None
+        return self
+
+    @property
+    def background(self):
+        if self._background is None:
+            fb = Framebuffer(self.width, self.height, self.color)
+            for draw in self.layers:
+                draw(fb)
+            self._background = bytes(fb.pixels)
+        return self._background
+
+    def frame(self):
+        return Framebuffer.from_bytes(self.width, self.height, self.background)
@@ -0,0 +1,1098 @@
+#!/usr/bin/env python3
+"""
+mvp.py
+
+Shared reader/writer for the tiny .mvp movie container used by the scripts in
+this folder. Pure stdlib. Frames are decoded lazily, one at a time, so memory
+stays flat no matter how long the clip is.
+
+Two legacy header layouts share the b'MVP1' magic:
+  flat  : <IIII fps, framecount, width, height   (stick_man.py, 3d_cube.py, ...)
+          every frame is an independent zlib-compressed RGB buffer
+  delta : <HHH width, height, fps + <I framecount (mvp_video.py)
+          frame 0 is raw, every later frame is (cur - prev) mod 256
+Both are followed by frames stored as uint32 compressed_length | zlib data.
+
+The b'MVP2' revision adds a frame-offset index so any frame can be reached
+without touching the ones before it:
+  header : 4s 'MVP2' | <IIII fps, framecount, width, height | <Q index_offset
+  frames : <BI frame_type, compressed_length | zlib data
+  index  : at index_offset, framecount x <QIB payload_offset, compressed_length, frame_type
+index_offset is 0 while a file is still being written; readers then fall
+back to scanning the per-frame prefixes. frame_type is one of the FRAME_*
+constants below; FRAME_DELTA and FRAME_TILE frames depend on the previous one.
+
+Usage:
+  python mvp.py info clip.mvp [--frames]         # header + frame size stats
+  python mvp.py verify clip.mvp ...              # decode every frame
+  python mvp.py transcode in.mvp out.mvp --layout indexed --encoding keyframed
+  python mvp.py extract in.mvp out.mvp --start 10 --end 40
+  python mvp.py bench clip.mvp ... [--repeat 3]  # decode MB/s and frames/s
+  python mvp.py export png clip.mvp out/f_%05d.png  # see mvp_export.py
+"""
+
+import argparse, bisect, mmap, os, queue, re, struct, sys, threading, time, zlib
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from save_png import (FAST_FILTERS, _badd, _bsub, _pack_bits, _pixels_as_ints, _unpack_bits,
+                      filter_scanlines, unfilter_scanlines)
+
+MAGIC_V1 = b'MVP1'
+MAGIC_V2 = b'MVP2'
+
+LAYOUT_FLAT = 'flat'
+LAYOUT_DELTA = 'delta'
+LAYOUT_INDEXED = 'indexed'
+
+# frame types (MVP2 prefix and index entries)
+FRAME_KEY = 0     # zlib(raw RGB)
+FRAME_DELTA = 1   # zlib((cur - prev) mod 256)
+FRAME_TILE = 2    # zlib(changed tiles only), see tile_encode
+FRAME_PALETTE = 3 # zlib(palette + packed colour indices), see palette_encode
+FRAME_FILTER = 4  # zlib(PNG-filtered scanlines), see save_png.filter_scanlines
+
+FRAME_NAMES = {FRAME_KEY: 'key', FRAME_DELTA: 'delta', FRAME_TILE: 'tile',
+               FRAME_PALETTE: 'palette', FRAME_FILTER: 'filter'}
+
+# frame types that are rebuilt on top of the previous frame
+INTER_FRAMES = (FRAME_DELTA, FRAME_TILE)
+
+V2_HEADER = struct.Struct('<IIIIQ')
+V2_PREFIX = struct.Struct('<BI')
+V2_ENTRY = struct.Struct('<QIB')
+
+# decoded-frame budget used by read_mvp (i.e. the players)
+DEFAULT_CACHE_BYTES = 128 * 1024 * 1024
+
+# ----------------- delta coding (mod 256) -----------------
+# Three interchangeable engines, all byte-identical:
+#   numpy  : uint8 array arithmetic wraps mod 256 by itself
+#   bigint : the whole frame as one Python int; bytes are kept from carrying
+#            into each other by masking off bit 7 and fixing it up with XOR
+#            (save_png._bsub/_badd, shared with the PNG row filters)
+#   python : the original per-byte loop (reference / benchmark baseline)
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def _sub_numpy(cb, pb):
+    return (np.frombuffer(cb, np.uint8) - np.frombuffer(pb, np.uint8)).tobytes()
+
+def _add_numpy(pb, db):
+    return (np.frombuffer(pb, np.uint8) + np.frombuffer(db, np.uint8)).tobytes()
+
+def _sub_python(cb, pb):
+    out = bytearray(len(cb))
+    for i in range(len(cb)):
+        out[i] = (cb[i] - pb[i]) & 0xFF
+    return bytes(out)
+
+def _add_python(pb, db):
+    out = bytearray(len(db))
+    for i in range(len(db)):
+        out[i] = (pb[i] + db[i]) & 0xFF
+    return bytes(out)
+
+DELTA_ENGINES = {
+    'python': (_sub_python, _add_python),
+    'bigint': (_bsub, _badd),
+}
+if np is not None:
+    DELTA_ENGINES['numpy'] = (_sub_numpy, _add_numpy)
+DELTA_ENGINE = 'numpy' if np is not None else 'bigint'
+_delta_sub, _delta_add = DELTA_ENGINES[DELTA_ENGINE]
+
+def delta_frame(prev_bytes, cur_bytes):
+    """Compute simple bytewise delta between prev and cur (subtraction modulo 256).
+       Returns bytes representing delta = (cur - prev) mod 256."""
+    if prev_bytes is None:
+        return cur_bytes  # keyframe: store raw
+    assert len(prev_bytes) == len(cur_bytes)
+    return _delta_sub(cur_bytes, prev_bytes)
+
+def apply_delta(prev_bytes, delta_bytes):
+    """Reconstruct cur = prev + delta (mod 256). If prev is None, delta is raw frame."""
+    if prev_bytes is None:
+        return delta_bytes
+    return _delta_add(prev_bytes, delta_bytes)
+
+# ----------------- tile (dirty-rectangle) coding -----------------
+# Payload before zlib: <HH tile_w, tile_h | bitmap, one bit per tile in
+# row-major tile order (LSB first) | the rows of every changed tile, in the
+# same order (edge tiles are clipped to the frame).
+TILE_HEADER = struct.Struct('<HH')
+
+def _tile_rects(width, height, tw, th):
+    """Yield (x0, x1, y0, y1) pixel rectangles of the tile grid, row-major."""
+    for y0 in range(0, height, th):
+        y1 = min(y0 + th, height)
+        for x0 in range(0, width, tw):
+            yield x0, min(x0 + tw, width), y0, y1
+
+def tile_encode(prev, cur, width, height, tile=16):
+    """Encode cur as the tiles that differ from prev (both raw RGB)."""
+    stride = width * 3
+    # whole rows that are unchanged rule out every tile they cross
+    row_changed = [prev[o:o + stride] != cur[o:o + stride]
+                   for o in range(0, stride * height, stride)]
+    rects = list(_tile_rects(width, height, tile, tile))
+    bitmap = bytearray((len(rects) + 7) // 8)
+    chunks = []
+    for n, (x0, x1, y0, y1) in enumerate(rects):
+        a, b = x0 * 3, x1 * 3
+        rows = [y for y in range(y0, y1) if row_changed[y]]
+        if not any(prev[y*stride + a:y*stride + b] != cur[y*stride + a:y*stride + b]
+                   for y in rows):
+            continue
+        bitmap[n >> 3] |= 1 << (n & 7)
+        for y in range(y0, y1):
+            chunks.append(cur[y*stride + a:y*stride + b])
+    return TILE_HEADER.pack(tile, tile) + bytes(bitmap) + b''.join(chunks)
+
+def tile_decode(prev, payload, width, height):
+    """Rebuild a frame from prev and a tile_encode payload."""
+    tw, th = TILE_HEADER.unpack_from(payload)
+    rects = list(_tile_rects(width, height, tw, th))
+    pos = TILE_HEADER.size
+    bitmap = payload[pos:pos + (len(rects) + 7) // 8]
+    pos += len(bitmap)
+    out = bytearray(prev)
+    stride = width * 3
+    for n, (x0, x1, y0, y1) in enumerate(rects):
+        if not bitmap[n >> 3] & (1 << (n & 7)):
+            continue
+        a, b = x0 * 3, x1 * 3
+        for y in range(y0, y1):
+            out[y*stride + a:y*stride + b] = payload[pos:pos + b - a]
+            pos += b - a
+    return bytes(out)
+
+# ----------------- palette (indexed colour) coding -----------------
+# Payload before zlib: <HBB ncolors, bits, rle | ncolors*3 RGB palette |
+# colour indices packed MSB-first at `bits` per pixel (1/2/4/8). With rle=1
+# the packed bytes are stored as (run_length, byte) pairs instead.
+# Everything runs in C: bytes.translate for per-byte lookups, extended slices
+# to (de)interleave, and big-int OR to merge bit planes (the bit packing and
+# table helpers are shared with save_png's indexed PNGs).
+PALETTE_HEADER = struct.Struct('<HBB')
+
+_RUN = re.compile(rb'(.)\1{0,254}', re.S)
+def _run_count(data):
+    """Number of runs of equal bytes (ignoring the 255 cap), computed in C."""
+    if len(data) < 2:
+        return len(data)
+    x = int.from_bytes(data[1:], 'big') ^ int.from_bytes(data[:-1], 'big')
+    return len(data) - x.to_bytes(len(data) - 1, 'big').count(0)
+
+def _rle_encode(data):
+    return b''.join(bytes((len(m.group()), m.group()[0])) for m in _RUN.finditer(data))
+
+def _rle_decode(data):
+    return b''.join(data[i+1:i+2] * data[i] for i in range(0, len(data), 2))
+
+def palette_encode(raw, max_colors=256):
+    """Encode raw RGB as palette + packed indices, or None if it has more
+    than max_colors colours."""
+    px = _pixels_as_ints(raw)
+    if len(set(px[::61])) > max_colors:  # cheap early out for busy frames
+        return None
+    colors = set(px)
+    if len(colors) > max_colors:
+        return None
+    colors = sorted(colors)
+    n = len(colors)
+    bits = 1 if n <= 2 else 2 if n <= 4 else 4 if n <= 16 else 8
+    if n == 1:
+        idx = bytes(len(px))
+    else:
+        lut = {c: i for i, c in enumerate(colors)}
+        idx = bytes(map(lut.__getitem__, px))
+    packed = _pack_bits(idx, bits)
+    rle = 2 * _run_count(packed) < len(packed)
+    if rle:
+        packed = _rle_encode(packed)
+    pal = b''.join(c.to_bytes(4, sys.byteorder)[:3] for c in colors)
+    return PALETTE_HEADER.pack(n, bits, rle) + pal + packed
+
+def palette_decode(payload, npixels):
+    """Expand a palette_encode payload back to raw RGB through lookup tables."""
+    n, bits, rle = PALETTE_HEADER.unpack_from(payload)
+    pos = PALETTE_HEADER.size
+    pal = payload[pos:pos + 3 * n]
+    data = payload[pos + 3 * n:]
+    if rle:
+        data = _rle_decode(data)
+    idx = _unpack_bits(data, bits, npixels)
+    out = bytearray(npixels * 3)
+    for c in range(3):
+        out[c::3] = idx.translate(pal[c::3] + bytes(256 - n))
+    return bytes(out)
+
+def decode_payload(ftype, data, prev, width, height):
+    """Turn one decompressed frame payload into raw RGB."""
+    if ftype == FRAME_DELTA:
+        return apply_delta(prev, data)
+    if ftype == FRAME_TILE:
+        return tile_decode(prev, data, width, height)
+    if ftype == FRAME_PALETTE:
+        return palette_decode(data, width * height)
+    if ftype == FRAME_FILTER:
+        return unfilter_scanlines(data, width, height)
+    return data
+
+# ----------------- header parsing -----------------
+def _read_header(f):
+    """Parse the header at the start of f.
+    Returns (layout, fps, count, width, height, index_offset)."""
+    magic = f.read(4)
+    if magic == MAGIC_V2:
+        head = f.read(V2_HEADER.size)
+        if len(head) < V2_HEADER.size:
+            raise ValueError("Truncated MVP header")
+        fps, count, width, height, index_offset = V2_HEADER.unpack(head)
+        return LAYOUT_INDEXED, fps, count, width, height, index_offset
+    if magic != MAGIC_V1:
+        raise ValueError("Invalid MVP file")
+    head = f.read(16)
+    if len(head) < 10:
+        raise ValueError("Truncated MVP header")
+    width, height, fps = struct.unpack('<HHH', head[:6])
+    # In the flat layout bytes 6..8 are the high half of the uint32 fps,
+    # which is always zero; the delta layout never has a zero height.
+    if height == 0 and len(head) == 16:
+        fps, count, width, height = struct.unpack('<IIII', head)
+        return LAYOUT_FLAT, fps, count, width, height, 0
+    count = struct.unpack('<I', head[6:10])[0]
+    f.seek(4 + 10)
+    return LAYOUT_DELTA, fps, count, width, height, 0
+
+# ----------------- writers -----------------
+def _encode_intra(raw, level, palette, filters, width, height):
+    if palette:
+        payload = palette_encode(raw)
+        if payload is not None:
+            return FRAME_PALETTE, zlib.compress(payload, level)
+    if filters:
+        return FRAME_FILTER, zlib.compress(filter_scanlines(raw, width, height, 3, filters), level)
+    return FRAME_KEY, zlib.compress(bytes(raw), level)
+
+def _encode_task(task):
+    """Compress one frame. task = (prev_raw or None, raw, cfg) with
+    cfg = (level, auto_key, tile, palette, filters, width, height). Inter
+    frames are tile coded when tile is set, delta coded otherwise. Keyframes
+    are palette coded when palette is set and the frame has <= 256 colours,
+    else PNG-filtered when filters is set. With auto_key an inter frame that
+    compresses worse than a keyframe is replaced by it."""
+    prev, raw, (level, auto_key, tile, palette, filters, width, height) = task
+    if prev is None:
+        return _encode_intra(raw, level, palette, filters, width, height)
+    if tile:
+        ftype = FRAME_TILE
+        comp = zlib.compress(tile_encode(prev, raw, width, height, tile), level)
+    else:
+        ftype = FRAME_DELTA
+        comp = zlib.compress(delta_frame(prev, raw), level)
+    if auto_key:
+        ktype, key = _encode_intra(raw, level, palette, filters, width, height)
+        if len(key) <= len(comp):
+            return ktype, key
+    return ftype, comp
+
+def _pack_header(layout, fps, count, width, height, index_offset=0):
+    if layout == LAYOUT_INDEXED:
+        return MAGIC_V2 + V2_HEADER.pack(fps, count, width, height, index_offset)
+    if layout == LAYOUT_DELTA:
+        return MAGIC_V1 + struct.pack('<HHH', width, height, fps) + struct.pack('<I', count)
+    return MAGIC_V1 + struct.pack('<IIII', fps, count, width, height)
+
+class MVPWriter:
+    """Streaming .mvp writer: frames are compressed and written as they arrive.
+
+        with MVPWriter('out.mvp', w, h, fps=10) as out:
+            for n in range(10000):
+                out.add_frame(render(n))
+
+    Memory stays constant however many frames are written. The frame count
+    (and, for MVP2, the index offset) is back-patched into the header on
+    close(); an MVP2 file that never got closed is still readable.
+
+    layout: LAYOUT_FLAT (<IIII, independent frames), LAYOUT_DELTA (<HHH,
+    mvp_video.py style) or LAYOUT_INDEXED (MVP2 with a frame index).
+    delta: delta-code frames after the first (implied by LAYOUT_DELTA,
+    optional for LAYOUT_INDEXED).
+    keyframe_interval: with delta on LAYOUT_INDEXED, store every Nth frame
+    as a keyframe (a GOP of N frames). A corrupt frame then only spoils the
+    rest of its GOP, and seeking decodes at most N frames.
+    auto_keyframes: with delta on LAYOUT_INDEXED, also store a keyframe
+    whenever the delta compresses worse than the raw frame (scene cuts).
+    tile_size: with delta on LAYOUT_INDEXED, code inter frames as the
+    tile_size x tile_size blocks that changed (FRAME_TILE) instead of a
+    full-frame delta. Best for a small sprite moving over a static scene.
+    palette: on LAYOUT_INDEXED, store keyframes with <= 256 colours as a
+    palette plus 1/2/4/8-bit indices (FRAME_PALETTE), run-length coded when
+    that is shorter. Flat-colour scenes shrink 3-24x before zlib sees them.
+    filters: on LAYOUT_INDEXED, store (non-palette) keyframes as PNG-style
+    predictive-filtered rows (FRAME_FILTER), picking per row the best of the
+    given filter types. True means FAST_FILTERS (None/Up), which undo
+    about as fast as raw frames decode; save_png.ALL_FILTERS adds
+    Sub/Average/Paeth, which undo per byte without NumPy.
+    workers: frames compressed concurrently (default: one per core; zlib
+    releases the GIL while it works). Delta frames are coded against the
+    previous raw frame, which is already known, so deltas run in parallel
+    too. At most 2*workers frames are in flight; they are written in order.
+    use_processes=True uses a process pool, for delta engines that hold the GIL.
+    """
+
+    def __init__(self, path, width, height, fps=10, layout=LAYOUT_FLAT, delta=None,
+                 workers=None, use_processes=False, level=-1,
+                 keyframe_interval=None, auto_keyframes=False, tile_size=None,
+                 palette=False, filters=None):
+        if delta is None:
+            delta = layout == LAYOUT_DELTA
+        if delta and layout == LAYOUT_FLAT:
+            raise ValueError("the flat layout cannot store delta frames")
+        if not delta and layout == LAYOUT_DELTA:
+            raise ValueError("the delta layout always stores delta frames")
+        if (keyframe_interval or auto_keyframes) and layout != LAYOUT_INDEXED:
+            raise ValueError("keyframes need frame-type flags: use LAYOUT_INDEXED")
+        if tile_size and not (delta and layout == LAYOUT_INDEXED):
+            raise ValueError("tile coding needs delta=True on LAYOUT_INDEXED")
+        if (palette or filters) and layout != LAYOUT_INDEXED:
+            raise ValueError("palette/filtered frames need frame-type flags: use LAYOUT_INDEXED")
+        if filters is True:
+            filters = FAST_FILTERS
+        if keyframe_interval is not None and keyframe_interval < 1:
+            raise ValueError("keyframe_interval must be >= 1")
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self.path = path
+        self.width, self.height, self.fps = width, height, fps
+        self.layout, self.delta, self.level = layout, delta, level
+        self.keyframe_interval = keyframe_interval
+        self.auto_keyframes = auto_keyframes
+        self.tile_size = tile_size
+        self.palette = palette
+        self.filters = tuple(filters) if filters else None
+        self._cfg = (level, auto_keyframes, tile_size, palette, self.filters, width, height)
+        self.frame_size = width * height * 3
+        self.frame_count = 0
+        self._queued = 0         # frames handed to add_frame (>= frame_count)
+        self._index = []         # [(payload_offset, size, frame_type), ...]
+        self._prev = None
+        self._pending = deque()
+        self._workers = workers
+        self._pool = None
+        if workers > 1:
+            pool = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+            self._pool = pool(workers)
+        self._f = open(path, 'wb')
+        self._f.write(_pack_header(layout, fps, 0, width, height))
+
+    def add_frame(self, raw):
+        """Queue one raw RGB frame (width*height*3 bytes) for writing."""
+        if len(raw) != self.frame_size:
+            raise ValueError("frame is {} bytes, expected {}".format(len(raw), self.frame_size))
+        if self._pool is not None or self.delta:
+            raw = bytes(raw)  # the caller may reuse its buffer for the next frame
+        prev = self._prev if self.delta else None
+        if self.keyframe_interval and self._queued % self.keyframe_interval == 0:
+            prev = None
+        task = (prev, raw, self._cfg)
+        self._queued += 1
+        if self.delta:
+            self._prev = raw
+        if self._pool is None:
+            self._write(*_encode_task(task))
+            return
+        self._pending.append(self._pool.submit(_encode_task, task))
+        while len(self._pending) >= 2 * self._workers:
+            self._write(*self._pending.popleft().result())
+
+    def _write(self, ftype, comp):
+        f = self._f
+        if self.layout == LAYOUT_INDEXED:
+            f.write(V2_PREFIX.pack(ftype, len(comp)))
+        else:
+            f.write(struct.pack('<I', len(comp)))
+        self._index.append((f.tell(), len(comp), ftype))
+        f.write(comp)
+        self.frame_count += 1
+
+    def close(self):
+        """Flush queued frames, write the index and patch the header."""
+        if self._f.closed:
+            return
+        try:
+            while self._pending:
+                self._write(*self._pending.popleft().result())
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown()
+            f = self._f
+            index_offset = 0
+            if self.layout == LAYOUT_INDEXED:
+                index_offset = f.tell()
+                for entry in self._index:
+                    f.write(V2_ENTRY.pack(*entry))
+            # frame count (and index offset) are only known now: patch the header
+            f.seek(0)
+            f.write(_pack_header(self.layout, self.fps, self.frame_count,
+                                 self.width, self.height, index_offset))
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def write_mvp(path, frames, width, height, fps=10, layout=LAYOUT_FLAT,
+              delta=None, workers=None, use_processes=False, **options):
+    """Write an iterable of raw RGB frames to path. See MVPWriter for the options."""
+    with MVPWriter(path, width, height, fps, layout, delta, workers, use_processes,
+                   **options) as out:
+        for raw in frames:
+            out.add_frame(raw)
+
+def write_mvp2(path, frames, width, height, fps=10, delta=False, workers=None,
+               keyframe_interval=None):
+    """Write frames (raw RGB buffers) as an indexed MVP2 file.
+    delta=True stores frames as deltas from the one before, with a keyframe
+    every keyframe_interval frames (only the first, if None)."""
+    write_mvp(path, frames, width, height, fps, LAYOUT_INDEXED, delta, workers,
+              keyframe_interval=keyframe_interval)
+
+# ----------------- decoded-frame cache -----------------
+class FrameCache:
+    """LRU cache of decoded frames, bounded by a byte budget.
+
+    Keys are (path, frame index), so one cache can be shared by several
+    readers. A clip that fits the budget ends up fully cached after its first
+    pass; a longer one keeps only the most recently used frames.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = self.misses = 0
+        self._frames = OrderedDict()
+
+    def get(self, key):
+        raw = self._frames.get(key)
+        if raw is None:
+            self.misses += 1
+            return None
+        self._frames.move_to_end(key)
+        self.hits += 1
+        return raw
+
+    def put(self, key, raw):
+        if len(raw) > self.max_bytes:
+            return
+        old = self._frames.pop(key, None)
+        if old is not None:
+            self.nbytes -= len(old)
+        self._frames[key] = raw
+        self.nbytes += len(raw)
+        while self.nbytes > self.max_bytes:
+            _, evicted = self._frames.popitem(last=False)
+            self.nbytes -= len(evicted)
+
+    def clear(self):
+        self._frames.clear()
+        self.nbytes = 0
+
+    def __contains__(self, key):
+        return key in self._frames
+
+    def __len__(self):
+        return len(self._frames)
+
+# ----------------- lazy reader -----------------
+class MVPReader:
+    """Lazy, seekable .mvp reader.
+
+    Iterate it for frames, index it like a list, or use seek()/read() and
+    frame_at(). Only the most recently decoded frame is kept; a delta frame is
+    rebuilt from the nearest keyframe (or from the last decoded frame, if that
+    is closer). MVP2 files carry a frame index; for MVP1 files the index is
+    built on first use by hopping over the length prefixes.
+
+    With use_mmap=True (the default) the file is memory-mapped and zlib is
+    handed memoryview slices of the mapping, so compressed payloads are never
+    copied and no read() syscalls are made per frame.
+
+    cache: a byte budget or a FrameCache (possibly shared) for decoded
+    frames. Cached frames are returned without decoding and also serve as
+    starting points for rebuilding later delta/tile frames.
+
+    Set timings to a dict to have frame_at() add the seconds it spends per
+    stage under 'read', 'decompress', 'delta-apply' (delta/tile frames) and
+    'unpack' (palette/filtered frames); None (the default) skips the clock.
+    """
+
+    def __init__(self, path, use_mmap=True, cache=None):
+        self.path = path
+        if isinstance(cache, int):
+            cache = FrameCache(cache) if cache > 0 else None
+        self.cache = cache
+        self._f = open(path, 'rb')
+        self._size = os.fstat(self._f.fileno()).st_size
+        self._map = self._view = None
+        try:
+            (self.layout, self.fps, self.frame_count, self.width,
+             self.height, self._index_offset) = _read_header(self._f)
+            if use_mmap:
+                self._map = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._view = memoryview(self._map)
+        except Exception:
+            self._f.close()
+            raise
+        self.frame_size = self.width * self.height * 3
+        self._data_start = self._f.tell()
+        self._index = None       # [(payload_offset, size, frame_type), ...]
+        self._keys = None        # sorted keyframe positions in _index
+        self._last = None        # (index, raw bytes) of the last decoded frame
+        self._cursor = 0         # next frame returned by read()
+        self.timings = None      # {stage: seconds} when profiling, see frame_at
+        if self.layout == LAYOUT_INDEXED and not self._index_offset:
+            self.frame_index()   # unfinished MVP2 file: recover the frame count
+
+    def __len__(self):
+        return self.frame_count
+
+    def __iter__(self):
+        for i in range(self.frame_count):
+            yield self.frame_at(i)
+
+    def __getitem__(self, index):
+        return self.frame_at(index)
+
+    # --- index ---
+    def frame_index(self):
+        """Return the list of (payload_offset, compressed_size, frame_type)."""
+        if self._index is None:
+            if self.layout == LAYOUT_INDEXED and self._index_offset:
+                data = self._read_at(self._index_offset, V2_ENTRY.size * self.frame_count)
+                self._index = list(V2_ENTRY.iter_unpack(data))
+            else:
+                self._index = self._scan_index()
+            # frame 0 starts a GOP whatever its type
+            self._keys = [i for i, e in enumerate(self._index)
+                          if i == 0 or e[2] not in INTER_FRAMES]
+        return self._index
+
+    def _scan_index(self):
+        index = []
+        pos = self._data_start
+        if self.layout == LAYOUT_INDEXED:
+            # unfinished MVP2 file (no index yet): scan prefixes to the end
+            while pos + V2_PREFIX.size <= self._size:
+                ftype, size = V2_PREFIX.unpack(self._read_at(pos, V2_PREFIX.size))
+                pos += V2_PREFIX.size
+                if pos + size > self._size:
+                    break  # torn last frame: keep the ones that made it
+                index.append((pos, size, ftype))
+                pos += size
+        else:
+            for i in range(self.frame_count):
+                if pos + 4 > self._size:
+                    raise ValueError("Truncated MVP file at frame {}".format(i))
+                (size,) = struct.unpack('<I', self._read_at(pos, 4))
+                ftype = FRAME_DELTA if self.layout == LAYOUT_DELTA and i > 0 else FRAME_KEY
+                index.append((pos + 4, size, ftype))
+                pos += 4 + size
+        self.frame_count = len(index)
+        return index
+
+    def keyframe_for(self, index):
+        """Index of the keyframe that decoding frame index has to start from."""
+        self.frame_index()
+        return self._keys[bisect.bisect_right(self._keys, index) - 1]
+
+    def keyframes(self):
+        """Indexes of all keyframes (GOP starts)."""
+        self.frame_index()
+        return list(self._keys)
+
+    # --- random access ---
+    def frame_at(self, index):
+        """Decode and return frame index (negative indexes count from the end)."""
+        if index < 0:
+            index += self.frame_count
+        if not 0 <= index < self.frame_count:
+            raise IndexError("frame index out of range")
+        if self._last is not None and self._last[0] == index:
+            return self._last[1]
+        cache = self.cache
+        if cache is not None:
+            raw = cache.get((self.path, index))
+            if raw is not None:
+                self._last = (index, raw)
+                return raw
+        entries = self.frame_index()
+        last = self._last
+        if last is not None and last[0] == index - 1 and entries[index][2] in INTER_FRAMES:
+            # sequential playback: one step on from the previous frame
+            raw = self._decode(entries[index], last[1])
+            if cache is not None:
+                cache.put((self.path, index), raw)
+            self._last = (index, raw)
+            return raw
+        start = self.keyframe_for(index)
+        raw = None
+        # resume from the closest already-decoded frame inside this GOP
+        if self._last is not None and start <= self._last[0] < index:
+            start, raw = self._last[0] + 1, self._last[1]
+        if cache is not None:
+            for j in range(index - 1, start - 1, -1):
+                if (self.path, j) in cache:
+                    start, raw = j + 1, cache.get((self.path, j))
+                    break
+        for i in range(start, index + 1):
+            raw = self._decode(entries[i], raw)
+            if cache is not None:
+                cache.put((self.path, i), raw)
+        self._last = (index, raw)
+        return raw
+
+    def _decode(self, entry, prev):
+        offset, size, ftype = entry
+        if self.timings is not None:
+            return self._timed_decode(offset, size, ftype, prev)
+        # bufsize: output is exactly one frame, so zlib allocates once
+        data = zlib.decompress(self._read_at(offset, size), bufsize=self.frame_size or 16384)
+        return decode_payload(ftype, data, prev, self.width, self.height)
+
+    def _timed_decode(self, offset, size, ftype, prev):
+        t = self.timings
+        t0 = time.perf_counter()
+        comp = self._read_at(offset, size)
+        t1 = time.perf_counter()
+        try:
+            data = zlib.decompress(comp, bufsize=self.frame_size or 16384)
+        finally:
+            del comp   # a mapped slice held by a traceback would block close()
+        t2 = time.perf_counter()
+        raw = decode_payload(ftype, data, prev, self.width, self.height)
+        t3 = time.perf_counter()
+        t['read'] = t.get('read', 0.0) + (t1 - t0)
+        t['decompress'] = t.get('decompress', 0.0) + (t2 - t1)
+        if ftype != FRAME_KEY:
+            stage = 'delta-apply' if ftype in INTER_FRAMES else 'unpack'
+            t[stage] = t.get(stage, 0.0) + (t3 - t2)
+        return raw
+
+    def frame_into(self, index, out):
+        """Decode frame index into out (a writable buffer of frame_size bytes,
+        e.g. a bytearray reused across calls) and return out."""
+        memoryview(out)[:self.frame_size] = self.frame_at(index)
+        return out
+
+    def seek(self, index):
+        """Position the read() cursor at frame index."""
+        if index < 0:
+            index += self.frame_count
+        if not 0 <= index <= self.frame_count:
+            raise IndexError("frame index out of range")
+        self._cursor = index
+
+    def tell(self):
+        return self._cursor
+
+    def read(self):
+        """Return the frame at the cursor and advance, or None at the end."""
+        if self._cursor >= self.frame_count:
+            return None
+        raw = self.frame_at(self._cursor)
+        self._cursor += 1
+        return raw
+
+    def _read_at(self, offset, size):
+        """Return size bytes at offset: a zero-copy slice when mapped."""
+        if offset + size > self._size:
+            raise ValueError("Truncated MVP data at offset {}".format(offset))
+        if self._view is not None:
+            return self._view[offset:offset + size]
+        self._f.seek(offset)
+        return self._f.read(size)
+
+    def close(self):
+        if self._view is not None:
+            view, self._view = self._view, None
+            mapping, self._map = self._map, None
+            try:
+                view.release()
+                mapping.close()
+            except BufferError:
+                pass   # a slice from _read_at is still alive: unmapped when it is collected
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# ----------------- decode-ahead prefetch -----------------
+class FramePrefetcher:
+    """Decode (and optionally convert) frames on a background thread.
+
+    A producer thread walks the reader from `start`, runs convert(raw) on each
+    frame and parks the results in a bounded queue `depth` frames deep. The
+    consumer (e.g. a Tk after() callback) calls get(), which never blocks:
+    it returns (index, frame) or None when the next frame is not ready yet
+    (FramePacer decides whether that was an underrun). The reader must not
+    be used by anyone else while the prefetcher runs. With loop=True
+    playback wraps around; otherwise get() returns END after the last frame.
+    """
+
+    END = (None, None)
+
+    def __init__(self, reader, convert=None, depth=4, loop=True, start=0):
+        self.reader = reader
+        self.convert = convert
+        self.loop = loop
+        self.delivered = 0
+        self._queue = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, args=(start,), daemon=True)
+        self._thread.start()
+
+    def _run(self, i):
+        try:
+            while not self._stop.is_set():
+                if i >= len(self.reader):
+                    if not self.loop or not len(self.reader):
+                        self._put(self.END)
+                        return
+                    i = 0
+                raw = self.reader.frame_at(i)
+                self._put((i, self.convert(raw) if self.convert else raw))
+                i += 1
+        except Exception as e:   # handed to the consumer by get()
+            self._error = e
+            self._put(self.END)
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def get(self):
+        """Next (index, frame), None if it is not decoded yet, or END."""
+        try:
+            item = self._queue.get_nowait()
+        except queue.Empty:
+            return None
+        if item is self.END and self._error is not None:
+            raise self._error
+        if item is not self.END:
+            self.delivered += 1
+        return item
+
+    def buffered(self):
+        """Frames decoded and waiting."""
+        return self._queue.qsize()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+# ----------------- playback pacing -----------------
+LATE_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100)
+
+class FramePacer:
+    """Drift-free, clock-driven frame pacing on top of a FramePrefetcher.
+
+    Frame n of the playback (counting across loops) is due at start + n/fps
+    on a monotonic clock, so slow ticks never push later frames back. Each
+    next() hands out the newest frame whose deadline has passed; older ones
+    that were never shown are dropped instead of slowing the clip down.
+    The clock starts when the first frame is delivered. A frame whose
+    deadline passes before the decoder has it counts as one underrun,
+    however often next() is polled meanwhile.
+    """
+
+    def __init__(self, prefetcher, fps, clock=time.monotonic):
+        self.prefetcher = prefetcher
+        self.period = 1.0 / fps
+        self.clock = clock
+        self.start = None
+        self.last = None
+        self.seq = 0          # frames taken from the prefetcher so far
+        self.shown = 0
+        self.dropped = 0
+        self.underruns = 0
+        self._starved = None  # seq of the frame last counted as an underrun
+        self.late = [0] * (len(LATE_BUCKETS_MS) + 1)
+        self._ended = False
+
+    def deadline(self, n):
+        return self.start + n * self.period
+
+    def next(self):
+        """(index, frame) to show now, None to keep the current one, or END."""
+        if self._ended:
+            return FramePrefetcher.END
+        now = self.clock()
+        if self.start is None:
+            item = self.prefetcher.get()
+            if item is None or item is FramePrefetcher.END:
+                self._ended = item is not None
+                return item
+            self.start = now
+            self.seq = 1
+        else:
+            due = int((now - self.start) / self.period)
+            item = None
+            while self.seq <= due:
+                got = self.prefetcher.get()
+                if got is None:
+                    if item is None and self._starved != self.seq:
+                        self.underruns += 1
+                        self._starved = self.seq
+                    break
+                if got is FramePrefetcher.END:
+                    self._ended = True
+                    if item is None:
+                        return got
+                    break
+                if item is not None:
+                    self.dropped += 1
+                item = got
+                self.seq += 1
+            if item is None:
+                return None
+        late_ms = (now - self.deadline(self.seq - 1)) * 1000.0
+        b = 0
+        while b < len(LATE_BUCKETS_MS) and late_ms >= LATE_BUCKETS_MS[b]:
+            b += 1
+        self.late[b] += 1
+        self.shown += 1
+        self.last = now
+        return item
+
+    def delay(self):
+        """Seconds until the next frame is due (0 if it already is)."""
+        if self.start is None:
+            return self.period
+        return max(0.0, self.deadline(self.seq) - self.clock())
+
+    def stats(self):
+        elapsed = (self.last - self.start) if self.shown > 1 else 0.0
+        return dict(shown=self.shown, dropped=self.dropped,
+                    underruns=self.underruns, elapsed=elapsed,
+                    target_fps=1.0 / self.period,
+                    fps=(self.shown - 1) / elapsed if elapsed else 0.0,
+                    late=list(self.late))
+
+    def report(self):
+        st = self.stats()
+        lines = ["shown {shown}, dropped {dropped}, underruns {underruns}, "
+                 "{fps:.2f} fps achieved (target {target_fps:.2f})".format(**st),
+                 "lateness histogram:"]
+        lo = 0
+        for hi, n in zip(LATE_BUCKETS_MS + (None,), st['late']):
+            label = "  {:>4}-{:<4} ms".format(lo, hi) if hi else "  {:>4}+     ms".format(lo)
+            lines.append("{} {:6d}".format(label, n))
+            lo = hi
+        return "\n".join(lines)
+
+def iter_frames(path):
+    """Yield decoded RGB frames from path one at a time."""
+    with MVPReader(path) as reader:
+        for raw in reader:
+            yield raw
+
+def read_mvp(path, cache=DEFAULT_CACHE_BYTES):
+    """Open path lazily. Returns (fps, width, height, frames) where frames is an
+    MVPReader: it supports len() and indexing but decodes on demand, keeping
+    up to `cache` bytes of decoded frames (LRU) for looping playback."""
+    reader = MVPReader(path, cache=cache)
+    return reader.fps, reader.width, reader.height, reader
+
+# ----------------- command line -----------------
+ENCODINGS = ('raw', 'delta', 'keyframed', 'tile')
+
+def _add_encoding_args(p):
+    p.add_argument('--layout', choices=(LAYOUT_FLAT, LAYOUT_DELTA, LAYOUT_INDEXED),
+                   default=LAYOUT_INDEXED, help="container layout (default: indexed)")
+    p.add_argument('--encoding', choices=ENCODINGS, default=None,
+                   help="raw: independent frames; delta: deltas after the first frame; "
+                        "keyframed: deltas with a keyframe every --keyframe-interval; "
+                        "tile: like keyframed but only changed tiles "
+                        "(default: delta for the delta layout, else raw)")
+    p.add_argument('--keyframe-interval', type=int, default=30, metavar='N')
+    p.add_argument('--auto-keyframes', action='store_true',
+                   help="also key frames whose delta compresses worse than the frame")
+    p.add_argument('--tile-size', type=int, default=16, metavar='PX')
+    p.add_argument('--palette', action='store_true', help="palette-code keyframes with <= 256 colours")
+    p.add_argument('--filter', action='store_true', help="PNG-filter (None/Up) keyframes")
+    p.add_argument('--fps', type=int, default=None, help="override the frame rate")
+    p.add_argument('--workers', type=int, default=None, help="compression threads (default: cores)")
+
+def _writer_options(args):
+    encoding = args.encoding or ('delta' if args.layout == LAYOUT_DELTA else 'raw')
+    opts = dict(layout=args.layout, delta=encoding != 'raw', workers=args.workers,
+                auto_keyframes=args.auto_keyframes, palette=args.palette,
+                filters=args.filter or None)
+    if encoding in ('keyframed', 'tile'):
+        opts['keyframe_interval'] = args.keyframe_interval
+    if encoding == 'tile':
+        opts['tile_size'] = args.tile_size
+    return opts
+
+def _copy_frames(reader, dst, indexes, args):
+    with MVPWriter(dst, reader.width, reader.height, args.fps or reader.fps,
+                   **_writer_options(args)) as out:
+        for i in indexes:
+            out.add_frame(reader.frame_at(i))
+    return out.frame_count
+
+def cmd_info(args):
+    with MVPReader(args.path) as r:
+        entries = r.frame_index()
+        sizes = [e[1] for e in entries]
+        print("{}: {} layout, {}x{}, {} fps, {} frames ({:.2f} s), {} bytes".format(
+            args.path, r.layout, r.width, r.height, r.fps, len(r),
+            len(r) / float(r.fps or 1), r._size))
+        if not sizes:
+            return 0
+        total = sum(sizes)
+        types = {}
+        for e in entries:
+            name = FRAME_NAMES.get(e[2], str(e[2]))
+            types[name] = types.get(name, 0) + 1
+        print("  frame types: " + ", ".join("{} {}".format(n, c) for n, c in sorted(types.items())))
+        print("  compressed frame bytes: min {} / mean {:.0f} / max {}, total {}".format(
+            min(sizes), total / float(len(sizes)), max(sizes), total))
+        print("  raw frame {} bytes, overall ratio {:.1f}:1".format(
+            r.frame_size, r.frame_size * len(sizes) / float(total or 1)))
+        if args.frames:
+            for i, (offset, size, ftype) in enumerate(entries):
+                print("  {:6d}  {:8s} offset {:10d}  {:8d} bytes".format(
+                    i, FRAME_NAMES.get(ftype, str(ftype)), offset, size))
+    return 0
+
+def cmd_verify(args):
+    status = 0
+    for path in args.paths:
+        try:
+            r = MVPReader(path)
+        except (OSError, ValueError) as e:
+            print("{}: FAIL {}".format(path, e))
+            status = 1
+            continue
+        with r:
+            bad = []
+            try:
+                n = len(r.frame_index())
+            except ValueError as e:
+                print("{}: FAIL {}".format(path, e))
+                status = 1
+                continue
+            for i in range(n):
+                try:
+                    raw = r.frame_at(i)
+                    if len(raw) != r.frame_size:
+                        raise ValueError("decoded {} bytes, expected {}".format(len(raw), r.frame_size))
+                except (zlib.error, ValueError, IndexError, struct.error) as e:
+                    bad.append((i, e))
+                    r._last = None   # rebuild later frames from their keyframe
+            if bad:
+                status = 1
+                print("{}: FAIL {} of {} frames".format(path, len(bad), n))
+                for i, e in bad[:20]:
+                    print("  frame {}: {}".format(i, e))
+            else:
+                print("{}: OK {} frames".format(path, n))
+    return status
+
+def cmd_transcode(args):
+    with MVPReader(args.src) as r:
+        n = _copy_frames(r, args.dst, range(len(r)), args)
+    print("Wrote {} ({} frames, {} bytes)".format(args.dst, n, os.path.getsize(args.dst)))
+    return 0
+
+def cmd_extract(args):
+    with MVPReader(args.src) as r:
+        end = len(r) if args.end is None else min(args.end, len(r))
+        n = _copy_frames(r, args.dst, range(args.start, end, args.step), args)
+    print("Wrote {} ({} frames, {} bytes)".format(args.dst, n, os.path.getsize(args.dst)))
+    return 0
+
+def cmd_bench(args):
+    for path in args.paths:
+        with MVPReader(path, use_mmap=not args.no_mmap) as r:
+            entries = r.frame_index()
+            comp = sum(e[1] for e in entries)
+            best = None
+            for _ in range(args.repeat):
+                r._last = None
+                t0 = time.perf_counter()
+                for i in range(len(entries)):
+                    r.frame_at(i)
+                dt = time.perf_counter() - t0
+                best = dt if best is None else min(best, dt)
+            best = best or 1e-9
+            n = len(entries)
+            print("{}: {} frames {}x{} ({}): {:.1f} frames/s, {:.1f} MB/s decoded, "
+                  "{:.1f} MB/s compressed (best of {})".format(
+                      path, n, r.width, r.height, r.layout, n / best,
+                      n * r.frame_size / best / 1e6, comp / best / 1e6, args.repeat))
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='mvp', description="Inspect and convert .mvp movies.")
+    sub = parser.add_subparsers(dest='cmd')
+    sub.required = True
+
+    p = sub.add_parser('info', help="print header and per-frame size statistics")
+    p.add_argument('path')
+    p.add_argument('--frames', action='store_true', help="list every frame")
+    p.set_defaults(func=cmd_info)
+
+    p = sub.add_parser('verify', help="check that every frame decodes")
+    p.add_argument('paths', nargs='+')
+    p.set_defaults(func=cmd_verify)
+
+    p = sub.add_parser('transcode', help="rewrite with another layout/encoding")
+    p.add_argument('src')
+    p.add_argument('dst')
+    _add_encoding_args(p)
+    p.set_defaults(func=cmd_transcode)
+
+    p = sub.add_parser('extract', help="copy a frame range into a new file")
+    p.add_argument('src')
+    p.add_argument('dst')
+    p.add_argument('--start', type=int, default=0)
+    p.add_argument('--end', type=int, default=None, help="exclusive (default: last frame)")
+    p.add_argument('--step', type=int, default=1)
+    _add_encoding_args(p)
+    p.set_defaults(func=cmd_extract)
+
+    p = sub.add_parser('bench', help="measure decode throughput")
+    p.add_argument('paths', nargs='+')
+    p.add_argument('--repeat', type=int, default=3)
+    p.add_argument('--no-mmap', action='store_true', help="read with file I/O instead of mmap")
+    p.set_defaults(func=cmd_bench)
+
+    import mvp_export   # imports mvp itself, so not at module level
+    p = sub.add_parser('export', help="write a PNG sequence or an APNG (mvp_export.py)")
+    mvp_export.add_export_args(p)
+    p.set_defaults(func=mvp_export.cmd_export)
+
+    args = parser.parse_args(argv)
+    try:
+        return args.func(args)
+    except (OSError, ValueError) as e:
+        parser.exit(2, "mvp: error: {}\n".format(e))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+mvp_export.py
+
+Hand .mvp movies to other tools: write a numbered PNG sequence (one
+save_png.write_png per frame, spread over a process pool) or one animated PNG
+(APNG) whose frames are compressed in parallel and written in order.
+Frames are decoded once, in order, in the main process; PNG filtering and
+zlib are the expensive part and run on every core.
+
+Usage:
+  python mvp_export.py png clip.mvp frames/frame_%05d.png [--workers N]
+  python mvp_export.py apng clip.mvp clip.png [--loops 0] [--workers N]
+(also available as: python mvp.py export ...)
+"""
+
+import argparse, os, struct, sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from mvp import MVPReader
+from save_png import PNG_SIGNATURE, _ihdr, _image_data, _pack_chunk, write_png
+
+# ----------------- process pool plumbing -----------------
+def _pool_map(fn, tasks, workers=None):
+    """map(fn, tasks) over a process pool, in order, at most 2*workers in flight.
+    tasks is consumed lazily, so only a few decoded frames exist at a time."""
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        for task in tasks:
+            yield fn(task)
+        return
+    with ProcessPoolExecutor(workers) as ex:
+        pending = deque()
+        for task in tasks:
+            pending.append(ex.submit(fn, task))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def _png_task(task):
+    path, width, height, raw = task
+    write_png(path, width, height, raw)
+    return path
+
+def _apng_task(task):
+    width, height, raw = task
+    return _image_data(width, height, raw)
+
+# ----------------- exporters -----------------
+def export_png_sequence(src, pattern, frames=None, workers=None):
+    """Write frames of src (default: all) to pattern % frame_index, e.g.
+    'out/frame_%05d.png'. Returns the written paths."""
+    try:
+        first = pattern % 0
+    except TypeError:
+        first = None
+    if first is None or first == pattern % 1:
+        raise ValueError("PNG pattern {!r} needs one %d-style field for the frame "
+                         "number, e.g. 'out/frame_%05d.png'".format(pattern))
+    folder = os.path.dirname(first)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with MVPReader(src) as r:
+        indexes = range(len(r)) if frames is None else frames
+        tasks = ((pattern % i, r.width, r.height, r.frame_at(i)) for i in indexes)
+        return list(_pool_map(_png_task, tasks, workers))
+
+def export_apng(src, dst, frames=None, workers=None, loops=0):
+    """Write frames of src (default: all) as one animated PNG at the clip's
+    frame rate. loops=0 repeats forever. Returns the number of frames."""
+    with MVPReader(src) as r:
+        indexes = list(range(len(r)) if frames is None else frames)
+        if not indexes:
+            raise ValueError("no frames to export")
+        w, h = r.width, r.height
+        with open(dst, 'wb') as f:
+            f.write(PNG_SIGNATURE)
+            f.write(_ihdr(w, h))
+            f.write(_pack_chunk(b'acTL', struct.pack('>II', len(indexes), loops)))
+            seq = 0
+            tasks = ((w, h, r.frame_at(i)) for i in indexes)
+            for n, data in enumerate(_pool_map(_apng_task, tasks, workers)):
+                # fcTL: seq, size, offset, delay = 1/fps s, dispose none, blend source
+                f.write(_pack_chunk(b'fcTL', struct.pack(
+                    '>IIIIIHHBB', seq, w, h, 0, 0, 1, r.fps or 1, 0, 0)))
+                seq += 1
+                if n == 0:
+                    f.write(_pack_chunk(b'IDAT', data))   # frame 0 doubles as the still image
+                else:
+                    f.write(_pack_chunk(b'fdAT', struct.pack('>I', seq) + data))
+                    seq += 1
+            f.write(_pack_chunk(b'IEND', b''))
+    return len(indexes)
+
+# ----------------- command line -----------------
+def add_export_args(p):
+    p.add_argument('format', choices=('png', 'apng'))
+    p.add_argument('src')
+    p.add_argument('dst', help="png: a %%-pattern such as out/f_%%05d.png; apng: the output file")
+    p.add_argument('--start', type=int, default=0)
+    p.add_argument('--end', type=int, default=None, help="exclusive (default: last frame)")
+    p.add_argument('--step', type=int, default=1)
+    p.add_argument('--loops', type=int, default=0, help="apng play count (0 = forever)")
+    p.add_argument('--workers', type=int, default=None, help="processes (default: cores)")
+
+def cmd_export(args):
+    with MVPReader(args.src) as r:
+        end = len(r) if args.end is None else min(args.end, len(r))
+    frames = range(args.start, end, args.step)
+    if args.format == 'png':
+        paths = export_png_sequence(args.src, args.dst, frames, args.workers)
+        print("Wrote {} PNG files ({} .. {})".format(len(paths), paths[0] if paths else '-',
+                                                     paths[-1] if paths else '-'))
+    else:
+        n = export_apng(args.src, args.dst, frames, args.workers, args.loops)
+        print("Wrote {} ({} frames, {} bytes)".format(args.dst, n, os.path.getsize(args.dst)))
+    return 0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='mvp_export', description="Export .mvp frames as PNG/APNG.")
+    add_export_args(parser)
+    args = parser.parse_args()
+    try:
+        sys.exit(cmd_export(args))
+    except (OSError, ValueError) as e:
+        parser.exit(2, "mvp_export: error: {}\n".format(e))
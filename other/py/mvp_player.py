@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+mvp_player.py
+
+The Tkinter .mvp player shared by the demo scripts (stick_man.py,
+stick_man_2.py, 3d_cube.py, mvp_video_demo.py, shimmer_gen_relu.py).
+
+Decoding runs ahead on a background thread (mvp.FramePrefetcher); the Tk
+after() callback only puts the next ready frame on screen. If a frame is not
+ready in time the previous one stays up and an underrun is counted.
+
+Timing comes from mvp.FramePacer: frame deadlines are computed from a
+monotonic start time, the callback is re-armed for the next deadline, and
+frames that are already stale when their turn comes are dropped, so the clip
+keeps wall-clock speed instead of drifting slower under load.
+
+Frames reach Tk through FramePresenter: the raw RGB buffer gets an in-memory
+P6 PPM header and is loaded into one reused PhotoImage, so Tk decodes it in C
+(no per-pixel colour strings, no temp files, no new images per frame).
+
+HeadlessPlayer runs the same prefetch, conversion and pacing code with no
+window (and no tkinter needed) and reports per-stage timings, for profiling
+playback on servers and CI.
+
+Usage:
+  python mvp_player.py clip.mvp
+  python mvp_player.py --headless clip.mvp [--no-pacing] [--no-mmap]
+"""
+
+import argparse, sys, time, zlib
+from mvp import FramePacer, FramePrefetcher, MVPReader, read_mvp
+try:
+    import tkinter as tk
+except ImportError:   # display-less boxes: only --headless works
+    tk = None
+
+class FramePresenter:
+    """Blits raw RGB frames into one PhotoImage that is reused for every frame.
+
+    With display=False no image is created and show() does nothing; the
+    conversion is still the real one (used by HeadlessPlayer).
+    """
+
+    def __init__(self, width, height, master=None, display=True):
+        self.width, self.height = width, height
+        self.header = "P6\n{} {}\n255\n".format(width, height).encode('ascii')
+        self.image = tk.PhotoImage(master=master, width=width, height=height) if display else None
+
+    def to_ppm(self, raw):
+        """Raw RGB frame -> binary PPM bytes (header + pixels, one memcpy)."""
+        return self.header + raw
+
+    def show(self, ppm):
+        if self.image is not None:
+            self.image.configure(data=ppm, format='PPM')
+
+class MVPPlayer:
+    def __init__(self, root, filename, prefetch=4, loop=True):
+        self.root = root
+        self.label = tk.Label(root, bg='black')
+        self.label.pack()
+        self.fps, self.width, self.height, self.frames = read_mvp(filename)
+        self.presenter = FramePresenter(self.width, self.height, master=root)
+        self.label.config(image=self.presenter.image)
+        self.index = 0
+        self.prefetcher = FramePrefetcher(self.frames, self.presenter.to_ppm,
+                                          depth=prefetch, loop=loop)
+        self.pacer = FramePacer(self.prefetcher, self.fps)
+        self.label.bind('<Destroy>', lambda e: self.prefetcher.close())
+        self.play()
+
+    @property
+    def underruns(self):
+        return self.pacer.underruns
+
+    def report(self):
+        """Achieved fps, dropped frames and the late-frame histogram."""
+        return self.pacer.report()
+
+    def play(self):
+        item = self.pacer.next()
+        if item is FramePrefetcher.END:
+            self.root.destroy()   # loop=False: the clip is over
+            return
+        if item is not None:
+            self.index, ppm = item
+            self.presenter.show(ppm)
+        self.root.after(max(1, int(round(self.pacer.delay() * 1000))), self.play)
+
+STAGES = ('read', 'decompress', 'delta-apply', 'unpack', 'convert')
+
+class HeadlessPlayer:
+    """MVPPlayer without a window, for profiling playback.
+
+    Plays the clip once through the same FramePrefetcher, PPM conversion and
+    FramePacer (pacing=False: as fast as the decoder goes) and records how
+    long the decode thread spends in each of STAGES.
+    """
+
+    def __init__(self, filename, prefetch=4, pacing=True, use_mmap=True):
+        self.frames = MVPReader(filename, use_mmap=use_mmap)   # plays once: no cache
+        self.fps, self.width, self.height = self.frames.fps, self.frames.width, self.frames.height
+        self.frames.timings = self.timings = {}
+        self.presenter = FramePresenter(self.width, self.height, display=False)
+        self.prefetch = prefetch
+        self.pacing = pacing
+        self.pacer = None
+        self.shown = 0
+        self.wall = 0.0
+        self.underruns = None
+
+    def _convert(self, raw):
+        t0 = time.perf_counter()
+        ppm = self.presenter.to_ppm(raw)
+        self.timings['convert'] = self.timings.get('convert', 0.0) + time.perf_counter() - t0
+        return ppm
+
+    def run(self):
+        prefetcher = FramePrefetcher(self.frames, self._convert, depth=self.prefetch, loop=False)
+        self.pacer = FramePacer(prefetcher, self.fps) if self.pacing else None
+        t0 = time.perf_counter()
+        try:
+            while True:
+                item = self.pacer.next() if self.pacer else prefetcher.get()
+                if item is FramePrefetcher.END:
+                    break
+                if item is not None:
+                    self.presenter.show(item[1])
+                    self.shown += 1
+                    if self.pacer:
+                        time.sleep(self.pacer.delay())
+                else:
+                    time.sleep(0.0005)   # decoder behind: wait, as the Tk loop would
+        finally:
+            prefetcher.close()
+            self.frames.close()
+        self.wall = time.perf_counter() - t0
+        # without pacing no frame is ever due, so there are no underruns
+        self.underruns = self.pacer.underruns if self.pacer else None
+        return self
+
+    def report(self):
+        n = len(self.frames)
+        busy = sum(self.timings.values()) or 1e-9
+        wall = self.wall or 1e-9
+        head = "{} frames {}x{} in {:.3f} s: {:.1f} frames/s, {:.1f} MB/s shown".format(
+            n, self.width, self.height, wall, self.shown / wall,
+            self.shown * self.width * self.height * 3 / wall / 1e6)
+        if self.underruns is not None:
+            head += ", {} underruns".format(self.underruns)
+        lines = [head, "decode thread: {:.1f} frames/s possible".format(n / busy)]
+        for stage in STAGES:
+            t = self.timings.get(stage, 0.0)
+            lines.append("  {:<12} {:9.2f} ms  {:7.3f} ms/frame  {:5.1f}%".format(
+                stage, t * 1000, t * 1000 / max(n, 1), 100 * t / busy))
+        if self.pacer:
+            lines.append(self.pacer.report())
+        return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='mvp_player', description="Play an .mvp movie.")
+    parser.add_argument('path')
+    parser.add_argument('--headless', action='store_true',
+                        help="no window: play once and print per-stage timings")
+    parser.add_argument('--no-pacing', action='store_true',
+                        help="with --headless: decode as fast as possible")
+    parser.add_argument('--no-mmap', action='store_true', help="with --headless: use file I/O")
+    parser.add_argument('--prefetch', type=int, default=4, metavar='N')
+    args = parser.parse_args(argv)
+    if not args.headless and tk is None:
+        parser.exit(2, "mvp_player: error: tkinter is not available (try --headless)\n")
+    try:
+        if args.headless:
+            player = HeadlessPlayer(args.path, args.prefetch, pacing=not args.no_pacing,
+                                    use_mmap=not args.no_mmap)
+            print(player.run().report())
+            return 0
+        root = tk.Tk()
+        root.title("MVP Player - " + args.path)
+        player = MVPPlayer(root, args.path, args.prefetch)
+    except (OSError, ValueError, zlib.error) as e:
+        parser.exit(2, "mvp_player: error: {}\n".format(e))
+    root.mainloop()
+    print(player.report())
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
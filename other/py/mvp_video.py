@@ -2,163 +2,143 @@
 """
 mvp_codec.py
 
-A pure-stdlib, self-contained lightweight "video" writer + player.
-Produces a compact .mvp container storing zlib-compressed frame deltas.
-Not MP4/H.264 — but demonstrates codec ideas and is base-python only.
+A lightweight "video" writer + player on top of mvp.py (the .mvp container
+and delta codec), mvp_player.py and save_png.py. Produces a compact .mvp
+container storing zlib-compressed frame deltas. Not MP4/H.264 — but
+demonstrates codec ideas and runs on base Python; NumPy, when installed,
+speeds up the demo frames and mvp.py's delta coding.
 
 Usage:
   python mvp_codec.py write out.mvp   # produce demo file
   python mvp_codec.py play out.mvp    # play it (Tkinter window)
+  python mvp_codec.py bench           # delta encode/decode frames/sec per engine
 """
 
 from __future__ import print_function
-import sys, struct, zlib, tempfile, os, time
+import sys, os, time
 from math import sqrt, sin
 from random import random, seed
+import mvp
+from mvp import MVPReader
+from mvp import delta_frame, apply_delta  # re-exported: these used to live here
+from save_png import _glow_table
+try:
+    import numpy as np
+except ImportError:
+    np = None
 seed(0)
 
 # ----------------- frame utilities (RGB bytearrays) -----------------
 def make_demo_frame(w,h,t):
-    """Generate a demo RGB frame as bytes (row-major r,g,b)."""
-    out = bytearray(w*h*3)
+    """Generate a demo RGB frame as bytes (row-major r,g,b).
+
+    sqrt/sin only depend on the integer squared distance to the glow centre
+    and the ** terms on the row, so they are tabulated with math and both the
+    NumPy grid and the stdlib loop do the same per-pixel arithmetic (same
+    bytes). Rows are one flat colour outside the glow radius."""
+    if not w or not h:
+        return b''
     cx,cy = w//2, int(h*0.66)
     maxr = min(w,h)*0.35
+    glow = _glow_table(maxr)
+    limit = len(glow) - 1
+    # per squared distance: background weight and the three glow terms
+    shade = []
+    for d2, gl in enumerate(glow):
+        anim = 0.3*(0.5 + 0.5*sin(t*2.0 + sqrt(d2)*0.02))  # animated offset
+        shade.append((1 - 0.6*gl, 255*gl*anim, 160*gl*anim, 40*gl*anim))
+    rows = []
     for y in range(h):
         ty = y / float(h-1)
-        for x in range(w):
-            dx = x - cx
-            dy = y - cy
-            dist = sqrt(dx*dx + dy*dy)
-            glow = max(0.0, 1.0 - dist/maxr)
-            # animated offset
-            anim = 0.3*(0.5 + 0.5*sin(t*2.0 + dist*0.02))
-            r = int( (20 + 220* (ty**1.2)) * (1 - 0.6*glow) + 255*glow*anim )
-            g = int( (12 + 120* (ty**1.1)) * (1 - 0.6*glow) + 160*glow*anim )
-            b = int( (8 + 40*(ty**1.3)) * (1 - 0.6*glow) + 40*glow*anim )
-            i = 3*(y*w + x)
-            out[i]   = max(0,min(255,r))
-            out[i+1] = max(0,min(255,g))
-            out[i+2] = max(0,min(255,b))
-    return bytes(out)
+        rows.append((20 + 220* (ty**1.2), 12 + 120* (ty**1.1), 8 + 40*(ty**1.3)))
 
-def delta_frame(prev_bytes, cur_bytes):
-    """Compute simple bytewise delta between prev and cur (XOR could be used; we use subtraction modulo 256).
-       Returns bytes representing delta = (cur - prev) mod 256."""
-    if prev_bytes is None:
-        return cur_bytes  # keyframe: store raw
-    # produce delta as bytes
-    pb = prev_bytes
-    cb = cur_bytes
-    assert len(pb) == len(cb)
-    out = bytearray(len(cb))
-    for i in range(len(cb)):
-        out[i] = (cb[i] - pb[i]) & 0xFF
-    return bytes(out)
+    if np is not None:
+        d2 = (np.arange(h) - cy)[:, None]**2 + (np.arange(w) - cx)[None, :]**2
+        terms = np.array(shade)[np.minimum(d2, limit)]
+        bg = np.array(rows)
+        out = np.empty((h, w, 3), np.uint8)
+        for c in range(3):
+            out[..., c] = np.clip(np.trunc(bg[:, c, None]*terms[..., 0] + terms[..., c+1]), 0, 255)
+        return out.tobytes()
 
-def apply_delta(prev_bytes, delta_bytes):
-    """Reconstruct cur = prev + delta (mod 256). If prev is None, delta is raw frame."""
-    if prev_bytes is None:
-        return delta_bytes
-    pb = prev_bytes
-    db = delta_bytes
-    out = bytearray(len(db))
-    for i in range(len(db)):
-        out[i] = (pb[i] + db[i]) & 0xFF
+    out = bytearray(w*h*3)
+    span = int(sqrt(limit)) + 1
+    xs = range(max(0, cx-span), min(w, cx+span+1))
+    for y, (r_bg, g_bg, b_bg) in enumerate(rows):
+        row = bytearray(bytes((max(0,min(255,int(r_bg))), max(0,min(255,int(g_bg))),
+                               max(0,min(255,int(b_bg))))) * w)
+        dy2 = (y - cy)**2
+        if dy2 < limit:
+            for x in xs:
+                k, gr, gg, gb = shade[min(dy2 + (x-cx)**2, limit)]
+                if gr or gg or gb or k != 1.0:
+                    i = 3*x
+                    row[i]   = max(0,min(255,int(r_bg*k + gr)))
+                    row[i+1] = max(0,min(255,int(g_bg*k + gg)))
+                    row[i+2] = max(0,min(255,int(b_bg*k + gb)))
+        out[y*w*3:(y+1)*w*3] = row
     return bytes(out)
 
 # ----------------- container format (.mvp) -----------------
 # header: 4s magic 'MVP1' | uint16 width | uint16 height | uint16 fps | uint32 framecount
 # follow frames: for each frame: uint32 compressed_length | compressed_data
 
-def write_mvp(path, width, height, fps, frames_bytes):
-    """frames_bytes: list of raw RGB frame bytes"""
-    with open(path,'wb') as f:
-        f.write(b'MVP1')
-        f.write(struct.pack('<HHH', width, height, fps))
-        f.write(struct.pack('<I', len(frames_bytes)))
-        prev = None
-        for raw in frames_bytes:
-            delta = delta_frame(prev, raw)
-            comp = zlib.compress(delta)
-            f.write(struct.pack('<I', len(comp)))
-            f.write(comp)
-            prev = raw
+def write_mvp(path, width, height, fps, frames_bytes, workers=None):
+    """frames_bytes: list of raw RGB frame bytes. Deltas are computed and
+       compressed on `workers` threads (default: one per core)."""
+    mvp.write_mvp(path, frames_bytes, width, height, fps, mvp.LAYOUT_DELTA, workers=workers)
 
 def read_mvp(path):
-    """Yield metadata and generator of decompressed frames (reconstructed)."""
-    with open(path,'rb') as f:
-        magic = f.read(4)
-        if magic != b'MVP1':
-            raise ValueError("Not MVP1")
-        width, height, fps = struct.unpack('<HHH', f.read(6))
-        framecount = struct.unpack('<I', f.read(4))[0]
-        frames = []
-        prev = None
-        for i in range(framecount):
-            clen = struct.unpack('<I', f.read(4))[0]
-            comp = f.read(clen)
-            delta = zlib.decompress(comp)
-            cur = apply_delta(prev, delta)
-            frames.append(cur)
-            prev = cur
-        return width, height, fps, frames
-
-# ----------------- PPM write (tiny) and Tkinter display -----------------
-def write_ppm_bytes(rgb_bytes, w,h):
-    """Return bytes of a P6 PPM file for given RGB buffer (not writing to disk)."""
-    header = "P6\n{} {}\n255\n".format(w,h).encode('ascii')
-    return header + rgb_bytes
+    """Return metadata and a lazy sequence of decompressed frames (reconstructed on demand)."""
+    reader = MVPReader(path, cache=mvp.DEFAULT_CACHE_BYTES)
+    return reader.width, reader.height, reader.fps, reader
 
+# ----------------- Tkinter display -----------------
 def play_mvp(path):
     import tkinter as tk
-    from tempfile import NamedTemporaryFile
-    width,height,fps,frames = read_mvp(path)
-    delay = int(1000.0 / fps)
+    from mvp_player import MVPPlayer
     root = tk.Tk()
     root.title("MVP Player - " + os.path.basename(path))
-    canvas = tk.Canvas(root, width=width, height=height, bg='black')
-    canvas.pack()
-    img_container = {'tkimg': None}
-    tmpfiles = []
-
-    def show_frame(index=[0]):
-        i = index[0]
-        if i >= len(frames):
-            root.destroy()
-            # cleanup
-            for p in tmpfiles:
-                try: os.remove(p)
-                except: pass
-            return
-        rgb = frames[i]
-        # write PPM to a temporary file (PhotoImage accepts PPM via file)
-        tmp = NamedTemporaryFile(delete=False, suffix='.ppm')
-        tmp.write(write_ppm_bytes(rgb, width, height))
-        tmp.close()
-        tmpfiles.append(tmp.name)
-        # load via PhotoImage
-        img = tk.PhotoImage(file=tmp.name)
-        img_container['tkimg'] = img  # keep ref
-        canvas.create_image(0,0, anchor='nw', image=img)
-        index[0] += 1
-        root.after(delay, show_frame)
-
-    root.after(0, show_frame)
+    player = MVPPlayer(root, path, loop=False)   # one reused PhotoImage, in-memory PPM
     root.mainloop()
+    print(player.report())
 
 # ----------------- demo write + play -----------------
 def demo_write(path, w=320,h=200,fps=12,frames_count=48):
-    frames = []
     t = 0.0
-    for n in range(frames_count):
-        frames.append(make_demo_frame(w,h,t))
-        t += 0.15
-    write_mvp(path, w,h,fps, frames)
+    with mvp.MVPWriter(path, w,h,fps, mvp.LAYOUT_DELTA) as out:
+        for n in range(frames_count):
+            out.add_frame(make_demo_frame(w,h,t))
+            t += 0.15
     print("Wrote", path, " ({}x{}, {} fps, {} frames)".format(w,h,fps,frames_count))
 
+# ----------------- delta engine benchmark -----------------
+def bench_delta(w=320, h=200, frames_count=8):
+    """Time delta_frame/apply_delta for every engine in mvp.DELTA_ENGINES."""
+    frames = [make_demo_frame(w,h,0.15*n) for n in range(frames_count)]
+    pairs = list(zip(frames, frames[1:]))
+    print("delta benchmark: {}x{} frames, {} deltas each way".format(w,h,len(pairs)))
+    baseline = None
+    for name, (sub, add) in sorted(mvp.DELTA_ENGINES.items(), key=lambda e: e[0] != 'python'):
+        t0 = time.perf_counter()
+        deltas = [sub(cur, prev) for prev, cur in pairs]
+        t1 = time.perf_counter()
+        rebuilt = [add(prev, d) for (prev, cur), d in zip(pairs, deltas)]
+        t2 = time.perf_counter()
+        assert rebuilt == [cur for prev, cur in pairs], name
+        enc_fps = len(pairs) / (t1 - t0)
+        dec_fps = len(pairs) / (t2 - t1)
+        if baseline is None:
+            baseline = (enc_fps, dec_fps)
+        print("  {:7s} encode {:9.1f} fps  decode {:9.1f} fps  ({:.0f}x / {:.0f}x)".format(
+            name, enc_fps, dec_fps, enc_fps / baseline[0], dec_fps / baseline[1]))
+
 if __name__ == '__main__':
+    if len(sys.argv) == 2 and sys.argv[1].lower() == 'bench':
+        bench_delta()
+        sys.exit(0)
     if len(sys.argv) < 3:
-        print("Usage: python mvp_codec.py write out.mvp   OR  python mvp_codec.py play out.mvp")
+        print("Usage: python mvp_codec.py write out.mvp   OR  python mvp_codec.py play out.mvp   OR  python mvp_codec.py bench")
         sys.exit(1)
     cmd = sys.argv[1].lower()
     path = sys.argv[2]
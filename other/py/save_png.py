@@ -2,15 +2,33 @@
 """
 save_png.py
 
-Write a PNG (truecolor, 8-bit RGB) using only Python stdlib (works on Python 3.5+).
-Produces out.png when run. Clean, minimal, and snappy.
+Write and read PNGs (8-bit RGB/RGBA and indexed colour) using only Python
+stdlib (works on Python 3.5+). Produces out.png when run. Clean, minimal,
+and snappy.
 
-No dependencies.
+No dependencies (NumPy is used for the scanline filters when it is installed).
+
+PNGWriter streams an image of any size to disk a band of rows at a time
+(constant memory, bounded IDAT chunks); write_png is a one-call wrapper.
+With workers > 1 the deflate work is spread over threads, pigz style.
+read_png loads 8-bit RGB, RGBA and palette PNGs back (any filter types;
+with NumPy, only None/Sub/Up rows are undone vectorized, see _unfilter_row).
+write_png also writes RGBA, and indexed-colour PNGs (1/2/4/8-bit, with tRNS
+for transparency) whenever the image fits a palette, or on request through
+median-cut quantization.
 """
 from __future__ import division, print_function
-import struct, zlib, binascii
+import os, struct, sys, zlib, binascii
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import accumulate
 from math import sqrt
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 # ---------- PNG chunk helpers ----------
 def _crc(chunk_type, data=b''):
     return binascii.crc32(chunk_type + data) & 0xffffffff
@@ -20,76 +38,820 @@ def _pack_chunk(chunk_type, data=b''):
     crc = struct.pack(">I", _crc(chunk_type, data))
     return length + chunk_type + data + crc
 
+# ---------- scanline filters ----------
+# The five PNG filter types. filter_scanlines picks one per row with the
+# usual heuristic (smallest sum of |filtered byte as int8|) and returns the
+# exact pre-zlib IDAT layout: filter byte + filtered row, for every row.
+# Both paths give identical bytes: NumPy filters the whole image at once; the
+# stdlib path treats a row as one big int (bytes masked to 7 bits so they
+# cannot carry into each other) for None/Sub/Up/Average, and spreads bytes
+# into 16-bit lanes for Paeth so its differences and compares fit in a lane.
+FILTER_NONE, FILTER_SUB, FILTER_UP, FILTER_AVERAGE, FILTER_PAETH = range(5)
+ALL_FILTERS = (0, 1, 2, 3, 4)
+FAST_FILTERS = (0, 2)      # None/Up: undone with one big-int add per row
+
+_ABS_INT8 = bytes(v if v < 128 else 256 - v for v in range(256))
+_lanes = {}
+
+def _lane_masks(n):
+    """(0x7f7f.., 0x8080..) as n-byte ints, cached per row/frame size."""
+    m = _lanes.get(n)
+    if m is None:
+        m = _lanes[n] = (int.from_bytes(b'\x7f' * n, 'little'),
+                         int.from_bytes(b'\x80' * n, 'little'))
+    return m
+
+def _bsub(a, b):
+    """Bytewise (a - b) mod 256."""
+    n = len(a)
+    lo, hi = _lane_masks(n)
+    x, y = int.from_bytes(a, 'little'), int.from_bytes(b, 'little')
+    return (((x | hi) - (y & lo)) ^ ((x ^ y ^ hi) & hi)).to_bytes(n, 'little')
+
+def _badd(a, b):
+    """Bytewise (a + b) mod 256."""
+    n = len(a)
+    lo, hi = _lane_masks(n)
+    x, y = int.from_bytes(a, 'little'), int.from_bytes(b, 'little')
+    return (((x & lo) + (y & lo)) ^ ((x ^ y) & hi)).to_bytes(n, 'little')
+
+def _bavg(a, b):
+    """Bytewise floor((a + b) / 2)."""
+    n = len(a)
+    lo, hi = _lane_masks(n)
+    x, y = int.from_bytes(a, 'little'), int.from_bytes(b, 'little')
+    # drop bit 0 of each byte before the shift so it cannot cross a byte
+    return ((x & y) + (((x ^ y) & (lo << 1)) >> 1)).to_bytes(n, 'little')
+
+_wide = {}
+
+def _wide_lanes(n):
+    """(one, full): 1 and 0xFFFF in each of n 16-bit lanes."""
+    m = _wide.get(n)
+    if m is None:
+        m = _wide[n] = (int.from_bytes(b'\x01\x00' * n, 'little'),
+                        int.from_bytes(b'\xff\xff' * n, 'little'))
+    return m
+
+def _widen(row):
+    buf = bytearray(2 * len(row))
+    buf[0::2] = row
+    return int.from_bytes(buf, 'little')
+
+def _paeth_predict(left, up, upleft):
+    """Bytewise PNG Paeth predictor, every byte at once in 16-bit lanes."""
+    n = len(left)
+    one, full = _wide_lanes(n)
+    a, b, c = _widen(left), _widen(up), _widen(upleft)
+
+    def ge(x, y, k):            # lanes of 1 where x >= y (x, y < 2**k)
+        return ((x + (one << k) - y) >> k) & one
+
+    def absdiff(x, y, k):
+        bias = one << k
+        d, e = x + bias - y, y + bias - x
+        m = ((d >> k) & one) * 0xFFFF
+        return ((d & m) | (e & (full ^ m))) - bias
+
+    pa, pb, pc = absdiff(b, c, 8), absdiff(a, c, 8), absdiff(a + b, c << 1, 9)
+    use_a = ge(pb, pa, 9) & ge(pc, pa, 9)
+    use_b = ge(pc, pb, 9) & ~use_a
+    use_c = one ^ use_a ^ use_b
+    pred = (a & use_a * 0xFF) | (b & use_b * 0xFF) | (c & use_c * 0xFF)
+    return pred.to_bytes(2 * n, 'little')[0::2]
+
+def _filter_rows_numpy(pixels, width, height, bpp, filters, prev):
+    stride = width * bpp
+    x = np.frombuffer(pixels, np.uint8, height * stride).reshape(height, stride)
+    a = np.zeros_like(x); a[:, bpp:] = x[:, :-bpp]
+    b = np.zeros_like(x); b[1:] = x[:-1]
+    c = np.zeros_like(x); c[1:, bpp:] = x[:-1, :-bpp]
+    if prev is not None:
+        b[0] = np.frombuffer(prev, np.uint8, stride)
+        c[0, bpp:] = b[0, :-bpp]
+    cands = []
+    for ft in filters:
+        if ft == FILTER_NONE:
+            cands.append(x)
+        elif ft == FILTER_SUB:
+            cands.append(x - a)
+        elif ft == FILTER_UP:
+            cands.append(x - b)
+        elif ft == FILTER_AVERAGE:
+            cands.append(x - ((a.astype(np.uint16) + b) >> 1).astype(np.uint8))
+        else:
+            ai, bi, ci = a.astype(np.int16), b.astype(np.int16), c.astype(np.int16)
+            pa, pb, pc = np.abs(bi - ci), np.abs(ai - ci), np.abs(ai + bi - 2 * ci)
+            pred = np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c))
+            cands.append(x - pred)
+    stack = np.stack(cands)
+    if len(filters) == 1:
+        choice = np.zeros(height, np.intp)
+    else:
+        scores = np.abs(stack.view(np.int8).astype(np.int32)).sum(axis=2)
+        choice = scores.argmin(axis=0)   # first minimum, like the stdlib path
+    out = np.empty((height, stride + 1), np.uint8)
+    out[:, 0] = np.asarray(filters, np.uint8)[choice]
+    out[:, 1:] = stack[choice, np.arange(height)]
+    return out.tobytes()
+
+def filter_scanlines(pixels, width, height, bpp=3, filters=ALL_FILTERS, prev=None):
+    """Filter raw pixel rows for zlib. Returns height rows of
+    (filter type byte + width*bpp filtered bytes), choosing per row among
+    `filters` the one with the smallest sum of absolute differences.
+    prev: the raw row above the first one, when filtering an image in bands."""
+    if np is not None and height and width:
+        return _filter_rows_numpy(pixels, width, height, bpp, filters, prev)
+    stride = width * bpp
+    out = bytearray()
+    prev = bytes(stride) if prev is None else bytes(prev)
+    for y in range(height):
+        row = bytes(pixels[y * stride:(y + 1) * stride])
+        left = bytes(bpp) + row[:-bpp]
+        best = None
+        for ft in filters:
+            if ft == FILTER_NONE:
+                cand = row
+            elif ft == FILTER_SUB:
+                cand = _bsub(row, left)
+            elif ft == FILTER_UP:
+                cand = _bsub(row, prev)
+            elif ft == FILTER_AVERAGE:
+                cand = _bsub(row, _bavg(left, prev))
+            else:
+                cand = _bsub(row, _paeth_predict(left, prev, bytes(bpp) + prev[:-bpp]))
+            if len(filters) == 1:
+                best = (0, ft, cand)
+                break
+            score = sum(cand.translate(_ABS_INT8))
+            if best is None or score < best[0]:
+                best = (score, ft, cand)
+        out.append(best[1])
+        out += best[2]
+        prev = row
+    return bytes(out)
+
+def _unsub(line, bpp):
+    row = bytearray(len(line))
+    for c in range(bpp):
+        # running sum per channel, wrapped to a byte
+        row[c::bpp] = bytes(map((255).__and__, accumulate(line[c::bpp])))
+    return row
+
+# Average and Paeth depend on the reconstructed byte to the left, so they
+# loop, with or without NumPy; each channel is its own chain, walked with zip
+# over extended slices. (Precomputing the row-above terms or tabulating the
+# Paeth choice only adds work to this loop, and an anti-diagonal NumPy
+# wavefront across rows breaks even only past about 200x200 pixels.)
+def _unavg(line, prev, bpp):
+    row = bytearray(len(line))
+    for ch in range(bpp):
+        out = []
+        a = 0
+        for x, b in zip(line[ch::bpp], prev[ch::bpp]):
+            a = (x + ((a + b) >> 1)) & 0xFF
+            out.append(a)
+        row[ch::bpp] = bytes(out)
+    return row
+
+def _unpaeth(line, prev, bpp):
+    row = bytearray(len(line))
+    upleft = bytes(bpp) + bytes(prev[:-bpp])
+    for ch in range(bpp):
+        out = []
+        a = 0
+        for x, b, c in zip(line[ch::bpp], prev[ch::bpp], upleft[ch::bpp]):
+            pa, pb = b - c, a - c
+            pc = abs(pa + pb)
+            pa, pb = abs(pa), abs(pb)
+            a = (x + (a if pa <= pb and pa <= pc else b if pb <= pc else c)) & 0xFF
+            out.append(a)
+        row[ch::bpp] = bytes(out)
+    return row
+
+def _unfilter_row(ft, line, prev, bpp):
+    """Reconstruct one row from its filter type, filtered bytes and the row above.
+    None/Sub/Up are whole-row operations (NumPy when installed, else big-int
+    and accumulate); Average/Paeth rows are a per-byte Python loop, so images
+    written with the default adaptive filters read back much slower than
+    FAST_FILTERS ones."""
+    if ft == FILTER_NONE:
+        return line
+    if ft == FILTER_SUB:
+        if np is not None:
+            return np.cumsum(np.frombuffer(line, np.uint8).reshape(-1, bpp),
+                             axis=0, dtype=np.uint8).tobytes()
+        return _unsub(line, bpp)
+    if ft == FILTER_UP:
+        if np is not None:
+            return (np.frombuffer(line, np.uint8) + np.frombuffer(prev, np.uint8)).tobytes()
+        return _badd(line, prev)
+    if ft == FILTER_AVERAGE:
+        return _unavg(line, prev, bpp)
+    if ft == FILTER_PAETH:
+        return _unpaeth(line, prev, bpp)
+    raise ValueError("Unknown PNG filter type {}".format(ft))
+
+def unfilter_scanlines(data, width, height, bpp=3):
+    """Undo filter_scanlines (or any PNG filtering): returns raw pixel bytes."""
+    stride = width * bpp
+    out = bytearray(stride * height)
+    prev = bytes(stride)
+    pos = 0
+    for y in range(height):
+        ft = data[pos]
+        row = _unfilter_row(ft, bytes(data[pos + 1:pos + 1 + stride]), prev, bpp)
+        pos += stride + 1
+        out[y * stride:(y + 1) * stride] = row
+        prev = row
+    return bytes(out)
+
+# ---------- palette helpers ----------
+# Shared with mvp.py's palette frames. Per-pixel work stays in C: colours
+# are compared as one native uint32 per pixel, indices are packed and
+# unpacked with bytes.translate and big-int OR over bit planes.
+_tables = {}
+
+def _table(kind, shift, mask=0xFF):
+    """Cached 256-byte translate table for (v << shift) or (v >> shift) & mask."""
+    key = (kind, shift, mask)
+    t = _tables.get(key)
+    if t is None:
+        if kind == 'shl':
+            t = bytes((v << shift) & 0xFF for v in range(256))
+        else:
+            t = bytes((v >> shift) & mask for v in range(256))
+        _tables[key] = t
+    return t
+
+def _pixels_as_ints(raw):
+    """One native uint32 per RGB pixel (R, G, B, 0 bytes) as a memoryview."""
+    n = len(raw) // 3
+    buf = bytearray(n * 4)
+    buf[0::4] = raw[0::3]
+    buf[1::4] = raw[1::3]
+    buf[2::4] = raw[2::3]
+    return memoryview(buf).cast('I')
+
+def _pack_bits(idx, bits):
+    if bits == 8:
+        return idx
+    per = 8 // bits
+    idx = idx + bytes(-len(idx) % per)
+    acc = 0
+    for k in range(per):
+        shift = 8 - bits * (k + 1)
+        acc |= int.from_bytes(idx[k::per].translate(_table('shl', shift)), 'big')
+    return acc.to_bytes(len(idx) // per, 'big')
+
+def _unpack_bits(packed, bits, count):
+    if bits == 8:
+        return packed[:count]
+    per = 8 // bits
+    out = bytearray(len(packed) * per)
+    for k in range(per):
+        shift = 8 - bits * (k + 1)
+        out[k::per] = packed.translate(_table('shr', shift, (1 << bits) - 1))
+    return bytes(out[:count])
+
+def _pixel_ints(pixels, channels):
+    """One native uint32 per pixel: RGB is padded with a zero byte, RGBA is as is."""
+    if channels == 3:
+        return _pixels_as_ints(pixels)
+    return memoryview(bytes(pixels)).cast('I')
+
+def _color_bytes(c, channels):
+    return c.to_bytes(4, sys.byteorder)[:channels]
+
+def _median_cut(px, channels, max_colors):
+    """Heckbert median cut over a 5-bit-per-channel histogram (alpha kept
+    exact). Returns (palette entries, indices)."""
+    key = bytearray(px.cast('B'))
+    shr3 = _table('shr', 3)
+    for c in range(3):
+        key[c::4] = key[c::4].translate(shr3)
+    keys = memoryview(key).cast('I')
+    entries = [(_color_bytes(k, channels), n, k) for k, n in Counter(keys).items()]
+
+    def box(items):
+        spans = [max(e[0][c] for e in items) - min(e[0][c] for e in items)
+                 for c in range(channels)]
+        span = max(spans)
+        return (span, sum(e[1] for e in items), spans.index(span), items)
+
+    boxes = [box(entries)]
+    while len(boxes) < max_colors:
+        splittable = [b for b in boxes if len(b[3]) > 1]
+        if not splittable:
+            break
+        span, total, c, items = target = max(splittable, key=lambda b: b[:2])
+        items = sorted(items, key=lambda e: e[0][c])
+        half, acc = total / 2.0, 0
+        for cut, e in enumerate(items, 1):
+            acc += e[1]
+            if acc >= half:
+                break
+        cut = min(cut, len(items) - 1)
+        boxes.remove(target)
+        boxes += [box(items[:cut]), box(items[cut:])]
+
+    palette, lut = [], {}
+    for i, (span, total, c, items) in enumerate(boxes):
+        color = bytearray()
+        for ch in range(channels):
+            mean = sum(e[0][ch] * e[1] for e in items) / total
+            color.append(int(round(mean * 255 / 31)) if ch < 3 else int(round(mean)))
+        palette.append(bytes(color))
+        for e in items:
+            lut[e[2]] = i
+    return palette, bytes(map(lut.__getitem__, keys))
+
+def quantize(pixels, channels=3, max_colors=256, exact_only=False):
+    """
+    Map RGB (channels=3) or RGBA (channels=4) pixels onto a palette.
+    Returns (palette, indices, exact): palette is a list of `channels`-byte
+    colours, indices one byte per pixel. Images with at most max_colors
+    colours are mapped exactly; others are reduced with median cut, or, with
+    exact_only=True, give None without doing that work.
+    """
+    px = _pixel_ints(pixels, channels)
+    colors = None
+    if len(set(px[::61])) <= max_colors:  # cheap early out for busy images
+        colors = set(px)
+    if colors is None or len(colors) > max_colors:
+        if exact_only:
+            return None
+        palette, idx = _median_cut(px, channels, max_colors)
+        return palette, idx, False
+    colors = sorted(colors)
+    if len(colors) == 1:
+        idx = bytes(len(px))
+    else:
+        lut = {c: i for i, c in enumerate(colors)}
+        idx = bytes(map(lut.__getitem__, px))
+    return [_color_bytes(c, channels) for c in colors], idx, True
+
 # ---------- PNG writer ----------
-def write_png(path, width, height, rgb_bytes):
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+COLOR_RGB, COLOR_PALETTE, COLOR_RGBA = 2, 3, 6
+_CHANNELS = {COLOR_RGB: 3, COLOR_PALETTE: 1, COLOR_RGBA: 4}
+
+def _ihdr(width, height, color=COLOR_RGB, depth=8):
+    # IHDR: width, height, bitdepth, colorType (2 truecolor, 3 palette, 6 RGBA),
+    # compression=0, filter=0, interlace=0
+    return _pack_chunk(b'IHDR', struct.pack(">IIBBBBB", width, height, depth, color, 0, 0, 0))
+
+def _image_data(width, height, rgb_bytes):
+    """The zlib stream that goes into IDAT (or an APNG fdAT) for one image."""
+    # for each scanline, prepend filter byte 0 + raw RGB bytes
+    row_bytes = width * 3
+    raw = bytearray()
+    for y in range(height):
+        start = y * row_bytes
+        raw.append(0)  # filter type 0 (None)
+        raw.extend(rgb_bytes[start:start + row_bytes])
+    # compress with zlib (default compression level)
+    return zlib.compress(bytes(raw))
+
+# ---------- parallel deflate (pigz style) ----------
+# The filtered stream is cut into SEGMENT_BYTES pieces that threads compress
+# independently as raw deflate (zlib releases the GIL while it works). Each
+# piece is primed with the 32 KiB before it as a preset dictionary, so
+# matches still reach across the cut, and ends on a full flush, i.e. on a
+# byte boundary with no final-block bit: the pieces simply concatenate. The
+# writer adds the 2-byte zlib header and the Adler-32 of the whole stream,
+# combined from the per-piece checksums.
+SEGMENT_BYTES = 1 << 18
+_WINDOW = 1 << 15
+_ADLER_BASE = 65521
+
+def _zlib_header(level, strategy):
+    if level == -1:
+        level = 6
+    if level < 2 or strategy in (zlib.Z_HUFFMAN_ONLY, zlib.Z_RLE):
+        flevel = 0
+    else:
+        flevel = 1 if level < 6 else 2 if level == 6 else 3
+    flg = flevel << 6
+    flg += 31 - (0x7800 + flg) % 31       # FCHECK: header is a multiple of 31
+    return bytes((0x78, flg))
+
+def _adler32_combine(adler1, adler2, len2):
+    """Adler-32 of A + B from adler32(A), adler32(B) and len(B)."""
+    a1, b1 = adler1 & 0xFFFF, adler1 >> 16
+    a2, b2 = adler2 & 0xFFFF, adler2 >> 16
+    a = (a1 + a2 - 1) % _ADLER_BASE
+    b = (b1 + b2 + len2 * (a1 - 1)) % _ADLER_BASE
+    return (b << 16) | a
+
+def _deflate_segment(data, zdict, level, strategy, last):
+    """Raw deflate of one segment -> (compressed bytes, adler32(data), len(data))."""
+    if zdict:
+        z = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, 8, strategy, zdict)
+    else:
+        z = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, 8, strategy)
+    out = z.compress(data) + z.flush(zlib.Z_FINISH if last else zlib.Z_FULL_FLUSH)
+    return out, zlib.adler32(data), len(data)
+
+# ---------- streaming writer ----------
+IDAT_CHUNK_SIZE = 1 << 16     # compressed bytes per IDAT chunk
+BAND_BYTES = 1 << 20          # raw bytes per band when write_png slices an image
+
+class PNGWriter:
+    """
+    Streaming PNG writer: memory use does not grow with the image.
+    - path: file name, or a binary file object to write into (left open)
+    - rows are fed in order with write_row(row), write_rows(band) for any
+      number of whole rows at once, or write_rows_from(iterable of bands)
+    Rows go straight through a zlib.compressobj; compressed output leaves as
+    IDAT chunks of chunk_size bytes, so only one band and one chunk are held.
+    close() (or leaving the with-block) checks that all rows arrived and
+    finishes the file.
+    - color, depth: COLOR_RGB or COLOR_RGBA at depth 8, or COLOR_PALETTE at
+      depth 1/2/4/8 with rows of packed palette indices
+    - palette: PLTE bytes (RGB triples), required for COLOR_PALETTE;
+      trns: tRNS chunk bytes (palette alphas, or an RGB colour key)
+    - filters: PNG filter types tried per row (see filter_scanlines);
+      (FILTER_NONE,) skips filtering. Default: all five, none for palettes
+    - level, strategy: zlib settings; strategy defaults to Z_FILTERED when
+      rows are filtered and Z_DEFAULT_STRATEGY otherwise, as libpng does
+    - workers: deflate threads; > 1 (or None for one per core) compresses
+      SEGMENT_BYTES pieces in parallel into one standard zlib stream
+    """
+
+    def __init__(self, path, width, height, level=-1, chunk_size=IDAT_CHUNK_SIZE,
+                 filters=None, strategy=None, workers=1, color=COLOR_RGB, depth=8,
+                 palette=None, trns=None):
+        if width <= 0 or height <= 0:
+            raise ValueError("PNG size must be positive, got {}x{}".format(width, height))
+        if color not in _CHANNELS or depth not in ((1, 2, 4, 8) if color == COLOR_PALETTE else (8,)):
+            raise ValueError("unsupported colour type {} at bit depth {}".format(color, depth))
+        if color == COLOR_PALETTE and not palette:
+            raise ValueError("a palette PNG needs a palette")
+        self.width, self.height = width, height
+        channels = _CHANNELS[color]
+        self.stride = (width * channels * depth + 7) // 8
+        self.bpp = max(1, channels * depth // 8)
+        self.rows = 0
+        self.chunk_size = chunk_size
+        if filters is None:
+            filters = (FILTER_NONE,) if color == COLOR_PALETTE else ALL_FILTERS
+        self.filters = tuple(filters)
+        self._unfiltered = self.filters == (FILTER_NONE,)
+        if strategy is None:
+            strategy = zlib.Z_DEFAULT_STRATEGY if self._unfiltered else zlib.Z_FILTERED
+        self._prev = None     # last raw row written, the "up" row for the next band
+        self.workers = workers or os.cpu_count() or 1
+        self._own = not hasattr(path, 'write')
+        self._f = open(path, 'wb') if self._own else path
+        self._pending = bytearray()
+        self._f.write(PNG_SIGNATURE)
+        self._f.write(_ihdr(width, height, color, depth))
+        if palette:
+            self._f.write(_pack_chunk(b'PLTE', bytes(palette)))
+        if trns:
+            self._f.write(_pack_chunk(b'tRNS', bytes(trns)))
+        if self.workers > 1:
+            self._z = None
+            self._level, self._strategy = level, strategy
+            self._pool = ThreadPoolExecutor(self.workers)
+            self._inflight = deque()
+            self._segment = bytearray()
+            self._zdict = b''
+            self._adler = 1
+            self._feed(_zlib_header(level, strategy))
+        else:
+            self._z = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS, 8, strategy)
+
+    def write_rows(self, data):
+        """Append whole rows: len(data) must be a multiple of the row size
+        (width*3 for RGB, width*4 for RGBA, packed indices for palettes)."""
+        stride = self.stride
+        n, extra = divmod(len(data), stride)
+        if extra:
+            raise ValueError("band of {} bytes is not whole {}-byte rows".format(len(data), stride))
+        if self.rows + n > self.height:
+            raise ValueError("more than {} rows written".format(self.height))
+        src = memoryview(data).cast('B')
+        if not n:
+            return
+        if self._unfiltered:
+            raw = bytearray((stride + 1) * n)   # filter bytes stay 0 (None)
+            for i in range(n):
+                start = i * (stride + 1) + 1
+                raw[start:start + stride] = src[i * stride:(i + 1) * stride]
+        else:
+            raw = filter_scanlines(src, self.stride // self.bpp, n, self.bpp,
+                                   self.filters, self._prev)
+            self._prev = bytes(src[(n - 1) * stride:])
+        self.rows += n
+        if self._z is not None:
+            self._feed(self._z.compress(raw))
+            return
+        seg = self._segment
+        seg += raw
+        if len(seg) >= SEGMENT_BYTES:
+            whole = len(seg) - len(seg) % SEGMENT_BYTES
+            for pos in range(0, whole, SEGMENT_BYTES):
+                self._submit(bytes(seg[pos:pos + SEGMENT_BYTES]), False)
+            del seg[:whole]
+
+    def _submit(self, data, last):
+        self._inflight.append(self._pool.submit(
+            _deflate_segment, data, self._zdict, self._level, self._strategy, last))
+        self._zdict = data[-_WINDOW:]
+        while len(self._inflight) > 2 * self.workers or (last and self._inflight):
+            out, adler, size = self._inflight.popleft().result()
+            self._adler = _adler32_combine(self._adler, adler, size)
+            self._feed(out)
+
+    write_row = write_rows
+
+    def write_rows_from(self, bands):
+        """write_rows() every item of an iterable (e.g. a row generator)."""
+        for band in bands:
+            self.write_rows(band)
+
+    def _feed(self, data):
+        pending = self._pending
+        pending += data
+        size = self.chunk_size
+        if len(pending) >= size:
+            whole = len(pending) - len(pending) % size
+            for pos in range(0, whole, size):
+                self._f.write(_pack_chunk(b'IDAT', bytes(pending[pos:pos + size])))
+            del pending[:whole]
+
+    def close(self):
+        if self._f is None:
+            return
+        try:
+            if self.rows != self.height:
+                raise ValueError("PNG needs {} rows, got {}".format(self.height, self.rows))
+            if self._z is not None:
+                self._feed(self._z.flush())
+            else:
+                self._submit(bytes(self._segment), True)
+                self._feed(struct.pack(">I", self._adler))
+            if self._pending:
+                self._f.write(_pack_chunk(b'IDAT', bytes(self._pending)))
+            self._f.write(_pack_chunk(b'IEND', b''))
+        finally:
+            self._release()
+
+    def _release(self):
+        if self._z is None:
+            self._pool.shutdown()
+        if self._own and self._f is not None:
+            self._f.close()
+        self._f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:   # already failing: just release the file
+            self._release()
+
+def write_png_rows(path, width, height, rows, **options):
+    """Write a PNG from an iterable of row bands (see PNGWriter)."""
+    with PNGWriter(path, width, height, **options) as png:
+        png.write_rows_from(rows)
+
+MODE_AUTO = 'auto'            # indexed when lossless, else truecolor
+MODE_TRUECOLOR = 'truecolor'  # RGB or RGBA as given
+MODE_INDEXED = 'indexed'      # always a palette; median cut past 256 colours
+
+def _indexed(pixels, channels, transparent, exact_only):
+    """Palette PNG pieces (depth, PLTE, tRNS, packed-row source), or None
+    when exact_only and the image has more than 256 colours."""
+    quantized = quantize(pixels, channels, exact_only=exact_only)
+    if quantized is None:
+        return None
+    palette, idx, _ = quantized
+    if channels == 4:
+        alphas = [e[3] for e in palette]
+    elif transparent is not None:
+        key = bytes(transparent)
+        alphas = [0 if e == key else 255 for e in palette]
+    else:
+        alphas = None
+    n = len(palette)
+    if alphas is not None and min(alphas) < 255:
+        # translucent entries first, so tRNS can stop at the last of them
+        order = sorted(range(n), key=lambda i: alphas[i] == 255)
+        remap = bytearray(256)
+        for new, old in enumerate(order):
+            remap[old] = new
+        palette, alphas = [palette[i] for i in order], [alphas[i] for i in order]
+        idx = idx.translate(remap)
+        trns = bytes(alphas[:sum(a < 255 for a in alphas)])
+    else:
+        trns = None
+    plte = b''.join(e[:3] for e in palette)
+    depth = 1 if n <= 2 else 2 if n <= 4 else 4 if n <= 16 else 8
+    return depth, plte, trns, idx
+
+def write_png(path, width, height, rgb_bytes, level=-1, strategy=None, filters=None,
+              workers=1, mode=MODE_AUTO, channels=3, transparent=None):
     """
     Write a PNG file.
     - width, height: image size
-    - rgb_bytes: bytes or bytearray of length width*height*3 (RGB row-major)
+    - rgb_bytes: bytes or bytearray of length width*height*channels, row-major
+      RGB (channels=3) or RGBA (channels=4)
+    - mode: MODE_AUTO writes an indexed PNG (at the smallest bit depth) when
+      the image has at most 256 colours and truecolor otherwise, so it is
+      always lossless; MODE_TRUECOLOR always writes RGB/RGBA; MODE_INDEXED
+      always writes a palette, median-cut quantized if needed
+    - transparent: an (r, g, b) colour to mark fully transparent (tRNS)
+    - level, strategy, filters, workers: see PNGWriter; truecolor rows are
+      adaptively filtered by default, workers > 1 deflates in parallel
     """
-    assert len(rgb_bytes) == width * height * 3, "rgb_bytes length mismatch"
+    assert len(rgb_bytes) == width * height * channels, "rgb_bytes length mismatch"
+    if channels not in (3, 4) or mode not in (MODE_AUTO, MODE_TRUECOLOR, MODE_INDEXED):
+        raise ValueError("unsupported channels {} / mode {!r}".format(channels, mode))
 
-    png_sig = b'\x89PNG\r\n\x1a\n'
-    with open(path, "wb") as f:
-        f.write(png_sig)
+    options = dict(level=level, filters=filters, strategy=strategy, workers=workers)
+    indexed = None
+    if mode != MODE_TRUECOLOR and width and height:
+        indexed = _indexed(rgb_bytes, channels, transparent, mode == MODE_AUTO)
+    if indexed is not None:
+        depth, plte, trns, idx = indexed
+        with PNGWriter(path, width, height, color=COLOR_PALETTE, depth=depth,
+                       palette=plte, trns=trns, **options) as png:
+            for y in range(height):
+                png.write_rows(_pack_bits(idx[y * width:(y + 1) * width], depth))
+        return
 
-        # IHDR: width, height, bitdepth=8, colorType=2 (truecolor), compression=0, filter=0, interlace=0
-        ihdr = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
-        f.write(_pack_chunk(b'IHDR', ihdr))
+    if channels == 3 and transparent is not None:
+        options['trns'] = struct.pack(">HHH", *transparent)
+    stride = width * channels
+    band = max(1, BAND_BYTES // stride) * stride
+    view = memoryview(rgb_bytes)
+    with PNGWriter(path, width, height, color=COLOR_RGB if channels == 3 else COLOR_RGBA,
+                   **options) as png:
+        for start in range(0, len(view), band):
+            png.write_rows(view[start:start + band])
 
-        # Image data: for each scanline, prepend filter byte 0 + raw RGB bytes
-        row_bytes = width * 3
-        raw = bytearray()
-        for y in range(height):
-            start = y * row_bytes
-            raw.append(0)  # filter type 0 (None)
-            raw.extend(rgb_bytes[start:start + row_bytes])
+# ---------- PNG reader ----------
+def _iter_chunks(f):
+    while True:
+        head = f.read(8)
+        if len(head) < 8:
+            raise ValueError("PNG ends without an IEND chunk")
+        length, ctype = struct.unpack(">I4s", head)
+        body = f.read(length + 4)
+        if len(body) < length + 4:
+            raise ValueError("Truncated PNG chunk {!r}".format(ctype))
+        data = body[:length]
+        if _crc(ctype, data) != struct.unpack(">I", body[length:])[0]:
+            raise ValueError("CRC mismatch in PNG chunk {!r}".format(ctype))
+        yield ctype, data
+        if ctype == b'IEND':
+            return
 
-        # compress with zlib (default compression level)
-        compressed = zlib.compress(bytes(raw))
-        f.write(_pack_chunk(b'IDAT', compressed))
+def read_png(path):
+    """
+    Read an 8-bit RGB or RGBA PNG, or a palette PNG of 1/2/4/8 bits per pixel.
+    Returns (width, height, channels, pixels): pixels is a bytearray of
+    width*height*channels bytes, row-major; palette images come back as RGB,
+    or RGBA when they carry a tRNS chunk. IDAT data is decompressed chunk by
+    chunk and every completed row is unfiltered straight into the output.
+    """
+    with open(path, 'rb') as f:
+        if f.read(8) != PNG_SIGNATURE:
+            raise ValueError("{} is not a PNG file".format(path))
+        chunks = _iter_chunks(f)
+        ctype, data = next(chunks)
+        if ctype != b'IHDR' or len(data) != 13:
+            raise ValueError("PNG does not start with IHDR")
+        width, height, depth, color, comp, filt, interlace = struct.unpack(">IIBBBBB", data)
+        if color == COLOR_PALETTE and depth in (1, 2, 4, 8):
+            bpp, bits = 1, depth
+            stride = (width * depth + 7) // 8
+        elif color in (COLOR_RGB, COLOR_RGBA) and depth == 8:
+            bpp, bits = (3 if color == COLOR_RGB else 4), 8
+            stride = width * bpp
+        else:
+            raise ValueError("unsupported PNG: colour type {}, bit depth {}".format(color, depth))
+        if comp or filt or interlace or not width or not height:
+            raise ValueError("unsupported PNG: compression {}, filter {}, interlace {}".format(
+                comp, filt, interlace))
 
-        # IEND
-        f.write(_pack_chunk(b'IEND', b''))
+        pixels = bytearray(height * stride) if color != COLOR_PALETTE else bytearray(width * height)
+        out = memoryview(pixels)
+        plte = trns = None
+        z = zlib.decompressobj()
+        buf = bytearray()
+        prev = bytes(stride)
+        y = 0
+        for ctype, data in chunks:
+            if ctype == b'PLTE':
+                plte = data
+            elif ctype == b'tRNS':
+                trns = data
+            elif ctype == b'IDAT':
+                buf += z.decompress(data)
+                view = memoryview(buf)
+                pos = 0
+                while y < height and len(buf) - pos >= stride + 1:
+                    row = _unfilter_row(buf[pos], bytes(view[pos + 1:pos + 1 + stride]), prev, bpp)
+                    pos += stride + 1
+                    if bits == 8:
+                        out[y * len(row):(y + 1) * len(row)] = row
+                    else:
+                        out[y * width:(y + 1) * width] = _unpack_bits(bytes(row), bits, width)
+                    prev = row
+                    y += 1
+                view.release()
+                del buf[:pos]
+        if y < height:
+            raise ValueError("PNG image data ends after {} of {} rows".format(y, height))
+    out.release()
+
+    if color != COLOR_PALETTE:
+        return width, height, bpp, pixels
+    if plte is None:
+        raise ValueError("palette PNG without PLTE chunk")
+    n = len(plte) // 3
+    channels = 4 if trns is not None else 3
+    rgb = bytearray(width * height * channels)
+    for c in range(3):
+        rgb[c::channels] = pixels.translate(plte[c::3] + bytes(256 - n))
+    if channels == 4:
+        rgb[3::4] = pixels.translate(trns[:256] + b'\xff' * (256 - len(trns[:256])))
+    return width, height, channels, rgb
 
 # ---------- Simple scene generator (demo) ----------
+# The only transcendental terms depend on the row (t ** k) or on the integer
+# squared distance to the hot spot (sqrt), so they come from small tables
+# built with math, and per pixel there is only + - * / and truncation. The
+# NumPy grid and the stdlib loop therefore produce identical bytes. Past the
+# glow radius glow is 0 and a row is one flat colour.
+def _glow_table(max_r):
+    """glow = max(0, 1 - dist/max_r) for every squared distance up to a limit
+    past max_r**2; the last entry (0.0) stands for everything further out."""
+    limit = int(max_r * max_r) + 2
+    return [max(0.0, 1.0 - sqrt(d2) / max_r) for d2 in range(limit + 1)]
+
+def _demo_image_numpy(w, h, cx, cy, glow, rows):
+    t, r_bg, g_bg, b_bg = (np.array(col)[:, None] for col in zip(*rows))
+    d2 = (np.arange(h) - cy)[:, None] ** 2 + (np.arange(w) - cx)[None, :] ** 2
+    g = np.asarray(glow)[np.minimum(d2, len(glow) - 1)]
+    alpha = g * 0.9
+    out = np.empty((h, w, 3), np.uint8)
+    for c, (scale, kg, kt, bg) in enumerate(((255, 0.6, 0.4, r_bg), (160, 0.5, 0.3, g_bg),
+                                             (40, 0.4, 0.2, b_bg))):
+        core = np.trunc(scale * (kg * g + kt * t))
+        out[..., c] = np.clip(np.trunc((1 - alpha) * bg + alpha * core), 0, 255)
+    return bytearray(out.tobytes())
+
 def make_demo_image(w, h):
     """
     Returns a bytearray of RGB pixels (w*h*3).
     Scene: warm vertical gradient + glowing circular hot spot
     """
-    pixels = bytearray(w * h * 3)
+    if not w or not h:
+        return bytearray()
     cx, cy = w // 2, int(h * 0.66)
     max_r = min(w, h) * 0.35
+    glow = _glow_table(max_r)
+    limit = len(glow) - 1
 
+    rows = []
     for y in range(h):
         t = y / (h - 1)
         # background gradient: dark top -> warm bottom
-        r_bg = int(20 + (220 - 20) * (t ** 1.2))
-        g_bg = int(12 + (120 - 12) * (t ** 1.1))
-        b_bg = int(8 + (40 - 8) * (t ** 1.3))
-
-        for x in range(w):
-            # distance-based glow
-            dx = x - cx
-            dy = y - cy
-            dist = sqrt(dx*dx + dy*dy)
-            glow = max(0.0, 1.0 - dist / max_r)  # 0..1
-            # core color (hot center)
-            r_core = int(255 * (0.6 * glow + 0.4 * (t)))
-            g_core = int(160 * (0.5 * glow + 0.3 * t))
-            b_core = int(40 * (0.4 * glow + 0.2 * t))
-
-            # blend background and core
-            alpha = glow * 0.9  # how much core influences pixel
-            r = int((1 - alpha) * r_bg + alpha * r_core)
-            g = int((1 - alpha) * g_bg + alpha * g_core)
-            b = int((1 - alpha) * b_bg + alpha * b_core)
-
-            idx = 3 * (y * w + x)
-            pixels[idx] = max(0, min(255, r))
-            pixels[idx + 1] = max(0, min(255, g))
-            pixels[idx + 2] = max(0, min(255, b))
+        rows.append((t, int(20 + (220 - 20) * (t ** 1.2)),
+                     int(12 + (120 - 12) * (t ** 1.1)),
+                     int(8 + (40 - 8) * (t ** 1.3))))
+    if np is not None:
+        return _demo_image_numpy(w, h, cx, cy, glow, rows)
+
+    pixels = bytearray(w * h * 3)
+    span = int(sqrt(limit)) + 1
+    xs = range(max(0, cx - span), min(w, cx + span + 1))
+    for y, (t, r_bg, g_bg, b_bg) in enumerate(rows):
+        row = bytearray(bytes((max(0, min(255, r_bg)), max(0, min(255, g_bg)),
+                               max(0, min(255, b_bg)))) * w)
+        dy2 = (y - cy) ** 2
+        if dy2 < limit:
+            for x in xs:
+                g = glow[min(dy2 + (x - cx) ** 2, limit)]
+                if g:
+                    # core color (hot center), blended over the background
+                    r_core = int(255 * (0.6 * g + 0.4 * t))
+                    g_core = int(160 * (0.5 * g + 0.3 * t))
+                    b_core = int(40 * (0.4 * g + 0.2 * t))
+                    alpha = g * 0.9  # how much core influences pixel
+                    i = 3 * x
+                    row[i] = max(0, min(255, int((1 - alpha) * r_bg + alpha * r_core)))
+                    row[i + 1] = max(0, min(255, int((1 - alpha) * g_bg + alpha * g_core)))
+                    row[i + 2] = max(0, min(255, int((1 - alpha) * b_bg + alpha * b_core)))
+        pixels[y * w * 3:(y + 1) * w * 3] = row
     return pixels
 
 # ---------- Example usage ----------
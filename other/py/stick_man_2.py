@@ -1,69 +1,51 @@
-import struct, zlib
 import random
+import tkinter as tk
+from framebuffer import Framebuffer, LayerStack, Sprite
+from mvp import MVPWriter
+from mvp_player import MVPPlayer
 
-# --- MVP Functions ---
-def write_mvp(filename, frames, width, height, fps=10):
-    with open(filename, "wb") as f:
-        f.write(b"MVP1")
-        f.write(struct.pack("<IIII", fps, len(frames), width, height))
-        for raw in frames:
-            comp = zlib.compress(bytes(raw))
-            f.write(struct.pack("<I", len(comp)))
-            f.write(comp)
-
-def read_mvp(filename):
-    with open(filename, "rb") as f:
-        if f.read(4) != b"MVP1":
-            raise ValueError("Invalid MVP file")
-        fps, frame_count, width, height = struct.unpack("<IIII", f.read(16))
-        frames = []
-        for _ in range(frame_count):
-            (size,) = struct.unpack("<I", f.read(4))
-            comp = f.read(size)
-            frames.append(zlib.decompress(comp))
-        return fps, width, height, frames
-
-# --- Draw scene frame ---
-def draw_frame(width, height, person_x, person_y):
-    frame = bytearray(width*height*3)
-    
-    # --- Background gradient (sky to ground) ---
-    for y in range(height):
-        for x in range(width):
-            idx = (y*width + x)*3
-            r = int(135 + (y/height)*50)  # sky to ground gradient
-            g = int(206 + (y/height)*40)
-            b = int(235 - (y/height)*60)
-            frame[idx:idx+3] = bytes([r,g,b])
+# --- Static layers: drawn once per frame size, cached as the background ---
+def draw_sky(fb):
+    # background gradient (sky to ground): one colour per row
+    for y in range(fb.height):
+        r = int(135 + (y/fb.height)*50)  # sky to ground gradient
+        g = int(206 + (y/fb.height)*40)
+        b = int(235 - (y/fb.height)*60)
+        fb.hline(0, fb.width, y, (r,g,b))
 
-    # --- River ---
+def draw_river(fb):
     river_width = 80
-    river_center = width//2 + 20
-    for y in range(height//2, height):
-        for x in range(river_center - river_width//2, river_center + river_width//2):
-            if 0<=x<width:
-                idx = (y*width + x)*3
-                frame[idx:idx+3] = bytes([0, 100 + (y%50), 200 + (y%30)])  # blue gradient
+    river_center = fb.width//2 + 20
+    for y in range(fb.height//2, fb.height):
+        fb.hline(river_center - river_width//2, river_center + river_width//2, y,
+                 (0, 100 + (y%50), 200 + (y%30)))  # blue gradient
 
-    # --- Trees ---
+def draw_trees(fb):
     num_trees = 5
     for t in range(num_trees):
         tx = 40 + t*70
-        ty = height//2 + 10
+        ty = fb.height//2 + 10
         # trunk
-        for y in range(ty, ty+40):
-            for x in range(tx-2, tx+2):
-                if 0<=x<width and 0<=y<height:
-                    idx = (y*width + x)*3
-                    frame[idx:idx+3] = bytes([101, 67, 33])
+        fb.fill_rect(tx-2, ty, tx+2, ty+40, (101, 67, 33))
         # leaves
-        for y in range(ty-15, ty):
-            for x in range(tx-10, tx+11):
-                if 0<=x<width and 0<=y<height:
-                    idx = (y*width + x)*3
-                    frame[idx:idx+3] = bytes([34,139,34])  # forest green
+        fb.fill_rect(tx-10, ty-15, tx+11, ty, (34,139,34))  # forest green
+
+_scenes = {}  # (width, height) -> LayerStack
+
+def scene_layers(width, height):
+    scene = _scenes.get((width, height))
+    if scene is None:
+        scene = _scenes[(width, height)] = \
+            LayerStack(width, height).add(draw_sky).add(draw_river).add(draw_trees)
+    return scene
+
+# --- Stickman sprite: (10, 5) in the sprite is the person's (x, y) ---
+PERSON_ORIGIN = (10, 5)
+KEY_COLOR = (255, 0, 255)  # transparent: not used by the stickman
 
-    # --- Stickman Person ---
+def make_person():
+    ox, oy = PERSON_ORIGIN
+    fb = Framebuffer(21, 45, KEY_COLOR)
     # colors
     head_color = [255,200,200]
     body_color = [255,255,255]
@@ -71,74 +53,34 @@ def draw_frame(width, height, person_x, person_y):
     leg_color = [200,200,255]
 
     # head
-    for y in range(person_y-5, person_y+5):
-        for x in range(person_x-5, person_x+5):
-            if 0<=x<width and 0<=y<height:
-                idx = (y*width + x)*3
-                frame[idx:idx+3] = bytes(head_color)
+    fb.fill_rect(ox-5, oy-5, ox+5, oy+5, head_color)
     # body
-    for y in range(person_y+5, person_y+25):
-        x = person_x
-        if 0<=x<width and 0<=y<height:
-            idx = (y*width + x)*3
-            frame[idx:idx+3] = bytes(body_color)
+    fb.vline(ox, oy+5, oy+25, body_color)
     # arms
-    for dx in range(-10,11):
-        x = person_x + dx
-        y = person_y + 15
-        if 0<=x<width and 0<=y<height:
-            idx = (y*width + x)*3
-            frame[idx:idx+3] = bytes(arm_color)
+    fb.hline(ox-10, ox+11, oy+15, arm_color)
     # legs
-    for dy in range(0,15):
-        for lx in [-7, 7]:
-            x = person_x + lx
-            y = person_y + 25 + dy
-            if 0<=x<width and 0<=y<height:
-                idx = (y*width + x)*3
-                frame[idx:idx+3] = bytes(leg_color)
+    for lx in [-7, 7]:
+        fb.vline(ox + lx, oy+25, oy+40, leg_color)
+    return Sprite.from_framebuffer(fb, key=KEY_COLOR)
 
-    return frame
+PERSON = make_person()
+
+# --- Draw scene frame: cached background + stamped sprite ---
+def draw_frame(width, height, person_x, person_y):
+    fb = scene_layers(width, height).frame()
+    fb.blit(PERSON, person_x - PERSON_ORIGIN[0], person_y - PERSON_ORIGIN[1])
+    return fb.pixels
 
 # --- Generate movie ---
 def generate_stamp_movie():
     width, height = 400, 600
-    frames = []
-    for i in range(30):
-        person_x = 50 + i*10
-        person_y = height//2
-        frames.append(draw_frame(width, height, person_x, person_y))
-    write_mvp("person_scene.mvp", frames, width, height, fps=10)
+    with MVPWriter("person_scene.mvp", width, height, fps=10) as out:
+        for i in range(30):
+            person_x = 50 + i*10
+            person_y = height//2
+            out.add_frame(draw_frame(width, height, person_x, person_y))
     print("Generated Person scene stamp: person_scene.mvp")
 
-# --- MVP Player ---
-import tkinter as tk
-
-class MVPPlayer:
-    def __init__(self, root, filename):
-        self.root = root
-        self.label = tk.Label(root)
-        self.label.pack()
-        self.fps, self.width, self.height, self.frames = read_mvp(filename)
-        self.tkimg = tk.PhotoImage(width=self.width, height=self.height)
-        self.label.config(image=self.tkimg)
-        self.index = 0
-        self.play()
-
-    def play(self):
-        raw = self.frames[self.index]
-        rows = []
-        for y in range(self.height):
-            row = []
-            for x in range(self.width):
-                i = (y*self.width + x)*3
-                r,g,b = raw[i], raw[i+1], raw[i+2]
-                row.append(f"#{r:02x}{g:02x}{b:02x}")
-            rows.append("{" + " ".join(row) + "}")
-        self.tkimg.put(" ".join(rows))
-        self.index = (self.index + 1) % len(self.frames)
-        self.root.after(int(1000/self.fps), self.play)
-
 # --- Run demo ---
 if __name__ == "__main__":
     generate_stamp_movie()